@@ -1,8 +1,138 @@
-import os, json, io
+import os, json, io, re, math, time, random, threading, queue, datetime, sqlite3, hashlib, codecs, shutil, uuid, heapq, html, collections
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import urlparse
 import requests
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.exceptions import ClientError, HTTPClientError, ConnectionError as BotoConnectionError
+from botocore.config import Config
 import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+import pyarrow as pa
+import pyarrow.parquet as pq
+import numpy as np
+from array import array
+
+# shared aws clients
+# boto3 clients are thread safe but slow to make (credential resolution, endpoint setup, a fresh
+# connection pool every time), so there's one per service and region, made on first use
+AWS_CLIENT_SETTINGS = {
+    'max_pool_connections': 64,
+    'connect_timeout': 10,
+    'read_timeout': 60,
+    'max_attempts': 10,
+}
+# model calls can take a while to generate
+AWS_READ_TIMEOUTS = {'bedrock-runtime': 300}
+# every other service gets adaptive retries, but these two make a single attempt: botocore retries
+# throttles in both standard and adaptive mode, so any retry left to it would hide throttles from our
+# own backoff (BedrockRateLimiter, TranscriptionJobScheduler), and adaptive mode's client side rate
+# limiting would fight ours. standard mode, since with one attempt there's nothing for adaptive to do.
+# 5xxs and dropped connections on them are retried by our code instead (is_transient_error)
+AWS_RETRIES = {
+    'bedrock-runtime': {'mode': 'standard', 'total_max_attempts': 1},
+    'transcribe': {'mode': 'standard', 'total_max_attempts': 1},
+}
+
+_clients = {}
+_client_stats = {}
+_clients_lock = threading.Lock()
+_session = None
+
+
+class ClientStats:
+    """
+    What a shared client has done: api calls made, retries botocore did under them, and calls
+    that failed (after retrying).
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.retries = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def after_call(self, http_response=None, parsed=None, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.retries += (parsed or {}).get('ResponseMetadata', {}).get('RetryAttempts', 0)
+            if http_response is not None and http_response.status_code >= 300:
+                self.errors += 1
+
+    def after_call_error(self, **kwargs):
+        # no response at all, e.g. connection errors that outlasted the retries
+        with self._lock:
+            self.calls += 1
+            self.errors += 1
+
+    def as_dict(self):
+        return {'calls': self.calls, 'retries': self.retries, 'errors': self.errors}
+
+
+def configure_clients(**settings):
+    """
+    Changes AWS_CLIENT_SETTINGS (e.g. max_pool_connections=128) for clients made from now on.
+    Clients already handed out keep their settings.
+    """
+    with _clients_lock:
+        AWS_CLIENT_SETTINGS.update(settings)
+        _clients.clear()
+
+
+def get_client(service, region=None):
+    """
+    The shared boto3 client for service in region (None for the default region), with pooled
+    connections, adaptive retries and timeouts from AWS_CLIENT_SETTINGS. The services in AWS_RETRIES
+    are the exception: they get a single attempt in standard mode, since we back off on them ourselves.
+    """
+    global _session
+    key = (service, region)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    with _clients_lock:
+        if key not in _clients:
+            # sessions aren't thread safe, so clients are only ever made under the lock
+            if _session is None:
+                _session = boto3.session.Session()
+            config = Config(
+                max_pool_connections=AWS_CLIENT_SETTINGS['max_pool_connections'],
+                connect_timeout=AWS_CLIENT_SETTINGS['connect_timeout'],
+                read_timeout=AWS_READ_TIMEOUTS.get(service, AWS_CLIENT_SETTINGS['read_timeout']),
+                retries=AWS_RETRIES.get(service, {'mode': 'adaptive',
+                                                  'max_attempts': AWS_CLIENT_SETTINGS['max_attempts']}),
+            )
+            client = _session.client(service, region_name=region, config=config)
+            stats = _client_stats.setdefault(key, ClientStats())
+            client.meta.events.register('after-call', stats.after_call)
+            client.meta.events.register('after-call-error', stats.after_call_error)
+            _clients[key] = client
+        return _clients[key]
+
+
+def client_stats():
+    """
+    Returns:
+        dict: '<service>/<region>' -> {'calls', 'retries', 'errors'} for every shared client so far.
+    """
+    with _clients_lock:
+        return {f'{service}/{region or "default"}': stats.as_dict()
+                for (service, region), stats in _client_stats.items()}
+
+
+def split_s3_https_uri(s3_uri):
+    """
+    Splits https://s3.<region>.amazonaws.com/<bucket>/<key> (the TranscriptFileUri format) into
+    (region, bucket, key). region is None if the host doesn't name one.
+    """
+    parsed = urlparse(s3_uri)
+    host = parsed.netloc.split('.')
+    region = host[1] if len(host) == 4 and host[0] == 's3' else None
+    bucket, _, key = parsed.path.lstrip('/').partition('/')
+    return region, bucket, key
+
 
 # overall script - container?
 """
@@ -109,6 +239,606 @@ def download_mp3_from_html(url, save_path):
         print(f"An error occurred: {e}")
 
 
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class HostLimiter:
+    """
+    Caps the number of concurrent requests per host, so a big pool of workers
+    doesn't hammer the recording server (or the CDN that serves the mp3s).
+    """
+
+    def __init__(self, per_host_limit):
+        self.per_host_limit = per_host_limit
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        host = urlparse(url).netloc
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.per_host_limit)
+            return self._semaphores[host]
+
+
+def make_http_session(pool_size=16):
+    """
+    A requests session with a keep-alive connection pool big enough for pool_size workers.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_recording_sid(url):
+    # recording urls end with ...&RecordingSid=RE...
+    return url.split('=')[-1]
+
+
+def _get_with_retries(session, url, max_retries=3, backoff=1.0, **kwargs):
+    """
+    GET with exponential backoff (plus jitter) on connection errors, 429s and 5xxs.
+    The caller is responsible for closing the returned response.
+    """
+    attempt = 0
+    while True:
+        try:
+            response = session.get(url, timeout=(10, 60), **kwargs)
+            if response.status_code not in RETRYABLE_STATUS_CODES:
+                response.raise_for_status()
+                return response
+            response.close()
+            error = requests.HTTPError(f"{response.status_code} for {url}", response=response)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            error = e
+        attempt += 1
+        if attempt > max_retries:
+            raise error
+        time.sleep(backoff * (2 ** (attempt - 1)) * (1 + random.random()))
+
+
+# the first <source ... src=...> on a recording page, read straight off the bytes
+_SOURCE_SRC = re.compile(rb"""<source\b[^>]*?(?<=\s)src\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s>"']+)(?=[\s>]))""", re.IGNORECASE)
+RECORDING_PAGE_READ_SIZE = 8 * 1024
+
+
+def find_mp3_url(response, read_size=RECORDING_PAGE_READ_SIZE):
+    """
+    get_mp3_url for a streamed recording page response: scans the page as it arrives and stops reading
+    as soon as the <source> tag has gone past, so neither the rest of the page nor a parse tree
+    is needed. Falls back to get_mp3_url on the whole page if the tag isn't matched.
+    """
+    page = b''
+    pos = 0
+    for chunk in response.iter_content(chunk_size=read_size):
+        page += chunk
+        match = _SOURCE_SRC.search(page, pos)
+        if match:
+            src = next(group for group in match.groups() if group is not None)
+            return html.unescape(src.decode(response.encoding or 'utf-8', 'replace'))
+        # a tag cut off at the end of the chunk is scanned again once the rest arrives
+        last_tag = page.rfind(b'<', pos)
+        pos = last_tag if last_tag != -1 else len(page)
+    return get_mp3_url(page.decode(response.encoding or 'utf-8', 'replace'))
+
+
+# a cached mp3 url that comes back with one of these has probably expired
+STALE_RECORDING_STATUS_CODES = {403, 404, 410}
+
+
+class RecordingUrlResolver:
+    """
+    Turns recording page urls into mp3 urls, remembering RecordingSid -> mp3 url in sqlite for
+    ttl_seconds, so each recording page is fetched at most once (and only read as far as its
+    <source> tag, see find_mp3_url). prefetch() resolves urls on background threads ahead of the
+    downloads; resolve() waits for a prefetch already in flight instead of fetching the page again.
+    hits / fetches count what happened since the resolver was opened.
+    """
+
+    def __init__(self, path='recording-urls.db', ttl_seconds=24 * 3600, max_retries=3, backoff=1.0):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.hits = 0
+        self.fetches = 0
+        self._lock = threading.Lock()
+        self._pending = {}  # sid -> future of a prefetch
+        self._executor = None
+        self._local = threading.local()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS recording_urls (
+                sid TEXT PRIMARY KEY,
+                mp3_url TEXT NOT NULL,
+                resolved_at REAL NOT NULL
+            )""")
+        self._conn.commit()
+
+    def get(self, sid):
+        with self._lock:
+            row = self._conn.execute('SELECT mp3_url, resolved_at FROM recording_urls WHERE sid = ?',
+                                     (sid,)).fetchone()
+        if row is None or (self.ttl_seconds is not None and time.time() - row[1] > self.ttl_seconds):
+            return None
+        return row[0]
+
+    def put(self, sid, mp3_url):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO recording_urls VALUES (?, ?, ?)', (sid, mp3_url, time.time()))
+            self._conn.commit()
+
+    def discard(self, sid):
+        with self._lock:
+            self._conn.execute('DELETE FROM recording_urls WHERE sid = ?', (sid,))
+            self._conn.commit()
+
+    def _fetch(self, url, session, host_limiter):
+        with host_limiter(url):
+            page = _get_with_retries(session, url, self.max_retries, self.backoff, stream=True)
+            try:
+                mp3_url = find_mp3_url(page)
+            finally:
+                page.close()
+        if not mp3_url:
+            raise ValueError(f"MP3 URL not found in the HTML for {url}")
+        with self._lock:
+            self.fetches += 1
+        self.put(get_recording_sid(url), mp3_url)
+        return mp3_url
+
+    def resolve(self, url, session, host_limiter, refresh=False):
+        """
+        The mp3 url for a recording page url. refresh=True ignores what's cached, e.g. when the
+        cached mp3 url has stopped working.
+        """
+        sid = get_recording_sid(url)
+        if not refresh:
+            mp3_url = self.get(sid)
+            if mp3_url:
+                with self._lock:
+                    self.hits += 1
+                return mp3_url
+            with self._lock:
+                future = self._pending.get(sid)
+            if future is not None:
+                try:
+                    return future.result()
+                except Exception:
+                    pass  # have another go ourselves
+        return self._fetch(url, session, host_limiter)
+
+    def prefetch(self, urls, host_limiter, max_workers=8):
+        """
+        Starts resolving urls that aren't cached on background threads and returns straight away.
+        Pass the same host_limiter the downloads use, so the two together stay within its limit.
+        """
+
+        def work(url):
+            if not hasattr(self._local, 'session'):
+                self._local.session = make_http_session(max_workers)
+            return self._fetch(url, self._local.session, host_limiter)
+
+        def done(sid):
+            with self._lock:
+                self._pending.pop(sid, None)
+
+        for url in urls:
+            sid = get_recording_sid(url)
+            if self.get(sid):
+                continue
+            with self._lock:
+                if sid in self._pending:
+                    continue
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='resolve')
+                future = self._executor.submit(work, url)
+                self._pending[sid] = future
+            future.add_done_callback(lambda _, sid=sid: done(sid))
+
+    def stats(self):
+        with self._lock:
+            count = self._conn.execute('SELECT COUNT(*) FROM recording_urls').fetchone()[0]
+        return {'hits': self.hits, 'fetches': self.fetches, 'entries': count}
+
+
+_recording_url_resolver = None
+_recording_url_resolver_lock = threading.Lock()
+
+
+def get_recording_url_resolver():
+    # opened on first use, shared by everything in the process
+    global _recording_url_resolver
+    with _recording_url_resolver_lock:
+        if _recording_url_resolver is None:
+            _recording_url_resolver = RecordingUrlResolver()
+        return _recording_url_resolver
+
+
+def hash_file(path, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    # sha256 of a local file, returned unfinished so more data can be added to it
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            hasher.update(chunk)
+    return hasher
+
+
+def fetch_recording(url, save_path, session, host_limiter, chunk_size=DOWNLOAD_CHUNK_SIZE, max_retries=3,
+                    backoff=1.0, resolver=None):
+    """
+    Downloads one recording (html page -> mp3) into save_path.
+    The mp3 url comes from resolver (the shared RecordingUrlResolver by default), so the page
+    is only fetched if the recording hasn't been resolved already.
+    The mp3 is written to save_path + '.part' first and renamed when complete, so an
+    interrupted download is resumed with a Range request on the next run.
+    Args:
+        url (str): The URL of the page containing the MP3 resource.
+        save_path (str): The path where the MP3 file will be saved.
+    Returns:
+        (int, str): number of bytes fetched over the network (0 if the file was already there)
+        and the sha256 of the recording, computed as it is written.
+    """
+    if os.path.exists(save_path):
+        return 0, hash_file(save_path).hexdigest()
+    if resolver is None:
+        resolver = get_recording_url_resolver()
+    mp3_url = resolver.resolve(url, session, host_limiter)
+    refreshed = False
+    os.makedirs(os.path.dirname(save_path) or '.', exist_ok=True)
+    part_path = save_path + '.part'
+    fetched = 0
+    attempt = 0
+    while True:
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        try:
+            # hold the host slot for the whole transfer, not just the request
+            with host_limiter(mp3_url):
+                mp3_response = _get_with_retries(session, mp3_url, max_retries, backoff,
+                                                 headers=headers, stream=True)
+                try:
+                    # a 200 to a Range request means the server ignored it, so start over
+                    mode = 'ab' if offset and mp3_response.status_code == 206 else 'wb'
+                    hasher = hash_file(part_path) if mode == 'ab' else hashlib.sha256()
+                    with open(part_path, mode, buffering=chunk_size) as file:
+                        for chunk in mp3_response.iter_content(chunk_size=chunk_size):
+                            file.write(chunk)
+                            hasher.update(chunk)
+                            fetched += len(chunk)
+                finally:
+                    mp3_response.close()
+            break
+        except requests.HTTPError as e:
+            # 416 means the part file already holds the whole recording
+            if offset and e.response is not None and e.response.status_code == 416:
+                hasher = hash_file(part_path)
+                break
+            if not refreshed and e.response is not None and e.response.status_code in STALE_RECORDING_STATUS_CODES:
+                # the resolved mp3 url has expired, get a fresh one from the page
+                mp3_url = resolver.resolve(url, session, host_limiter, refresh=True)
+                refreshed = True
+                continue
+            raise
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError):
+            # keep what we have and resume from there
+            attempt += 1
+            if attempt > max_retries:
+                raise
+            time.sleep(backoff * (2 ** (attempt - 1)) * (1 + random.random()))
+    os.replace(part_path, save_path)
+    return fetched, hasher.hexdigest()
+
+
+def download_recordings(call_urls, save_dir='mp3-downloads', max_workers=16, per_host_limit=8, max_retries=3,
+                        backoff=1.0, chunk_size=DOWNLOAD_CHUNK_SIZE):
+    """
+    Downloads the recordings for the calls returned by get_call_urls concurrently.
+    Each worker thread keeps its own keep-alive session, requests to any one host are capped
+    at per_host_limit, failed requests are retried with backoff and partial files are resumed.
+    Args:
+        call_urls (list): output of get_call_urls.
+        save_dir (str): directory to save the mp3s into, as <RecordingSid>.mp3
+    Returns:
+        list: one dict per call, in the same order as call_urls, with the saved 'path'
+        (None on failure), the 'bytes' fetched, the recording's 'sha256' and the 'error' if there was one.
+    """
+    local = threading.local()
+    host_limiter = HostLimiter(per_host_limit)
+    resolver = get_recording_url_resolver()
+    # the recording pages are resolved ahead of the downloads that need them
+    resolver.prefetch([call_url['url'] for call_url in call_urls
+                       if not os.path.exists(os.path.join(save_dir, f"{get_recording_sid(call_url['url'])}.mp3"))],
+                      host_limiter)
+
+    def worker(call_url):
+        if not hasattr(local, 'session'):
+            local.session = make_http_session(per_host_limit)
+        save_path = os.path.join(save_dir, f"{get_recording_sid(call_url['url'])}.mp3")
+        fetched, content_hash = fetch_recording(call_url['url'], save_path, local.session, host_limiter, chunk_size,
+                                                max_retries, backoff, resolver)
+        return save_path, fetched, content_hash
+
+    results = [None] * len(call_urls)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(worker, call_url): i for i, call_url in enumerate(call_urls)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                path, fetched, content_hash = future.result()
+                results[i] = {'call': call_urls[i], 'path': path, 'bytes': fetched, 'sha256': content_hash,
+                              'error': None}
+            except Exception as e:
+                print(f"Failed to download {call_urls[i]['url']}: {e}")
+                results[i] = {'call': call_urls[i], 'path': None, 'bytes': 0, 'sha256': None, 'error': str(e)}
+    report_throughput('Downloaded', results, time.monotonic() - start)
+    return results
+
+
+def report_throughput(verb, results, elapsed):
+    num_files = sum(1 for r in results if r['error'] is None)
+    mb = sum(r['bytes'] for r in results) / (1024 * 1024)
+    elapsed = max(elapsed, 1e-9)
+    print(f"{verb} {num_files}/{len(results)} files, {mb:.1f} MB in {elapsed:.1f}s "
+          f"({num_files / elapsed:.2f} files/s, {mb / elapsed:.2f} MB/s)")
+    return {'files': num_files, 'mb': mb, 'seconds': elapsed,
+            'files_per_second': num_files / elapsed, 'mb_per_second': mb / elapsed}
+
+
+S3_PART_SIZE = 8 * 1024 * 1024  # s3 needs at least 5 MB per part, except the last one
+# most recordings are a few MB and go up in one PUT; the concurrency comes from uploading many
+# recordings at once, so each one only gets a few threads for its parts
+UPLOAD_TRANSFER_CONFIG = TransferConfig(multipart_threshold=S3_PART_SIZE, multipart_chunksize=S3_PART_SIZE,
+                                        max_concurrency=4)
+# recordings go up as <prefix>/date=<call date>/<RecordingSid>.mp3
+RECORDINGS_PREFIX = 'recordings'
+
+
+def recording_key(call_url, prefix=RECORDINGS_PREFIX):
+    return f"{prefix}/date={call_url.get('date') or NO_DATE_PARTITION}/{get_recording_sid(call_url['url'])}.mp3"
+
+
+def s3_etag(path, transfer_config=UPLOAD_TRANSFER_CONFIG):
+    """
+    The ETag s3 will give this file uploaded with transfer_config: the file's md5, or for a multipart
+    upload the md5 of the parts' md5s followed by -<number of parts>.
+    """
+    if os.path.getsize(path) < transfer_config.multipart_threshold:
+        hasher = hashlib.md5()
+        with open(path, 'rb') as file:
+            for chunk in iter(lambda: file.read(DOWNLOAD_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+        return hasher.hexdigest()
+    digests = []
+    with open(path, 'rb') as file:
+        for part in iter(lambda: file.read(transfer_config.multipart_chunksize), b''):
+            digests.append(hashlib.md5(part).digest())
+    return f"{hashlib.md5(b''.join(digests)).hexdigest()}-{len(digests)}"
+
+
+def upload_recordings(call_urls, bucket, save_dir='mp3-downloads', max_workers=16,
+                      transfer_config=UPLOAD_TRANSFER_CONFIG, s3=None):
+    """
+    Uploads the downloaded recordings for these calls to s3://bucket/<recording_key>, many at once over
+    one client. Recordings already there with the same size and ETag (from an earlier run) are skipped;
+    what's there is found by listing each date partition once, not a HEAD per recording.
+    Returns:
+        list: one dict per call, in the same order as call_urls, with the 'key' (None on failure),
+        the 'bytes' uploaded, whether it was 'skipped' and the 'error' if there was one.
+    """
+    if s3 is None:
+        s3 = get_client('s3', 'us-east-1')
+    keys = [recording_key(call_url) for call_url in call_urls]
+    partitions = sorted({key.rsplit('/', 1)[0] + '/' for key in keys})
+    present = {}
+    # a partition that can't be listed just gets uploaded again
+    for listed in run_ordered(lambda partition: list_objects(bucket, partition, s3), partitions):
+        for obj in listed['result'] or []:
+            present[obj['Key']] = obj
+
+    def worker(i):
+        path = os.path.join(save_dir, f"{get_recording_sid(call_urls[i]['url'])}.mp3")
+        size = os.path.getsize(path)
+        existing = present.get(keys[i])
+        # sizes first, so a file is only read for its ETag when it's likely to match
+        if existing and existing['Size'] == size and existing['ETag'].strip('"') == s3_etag(path, transfer_config):
+            return 0, True
+        s3.upload_file(path, bucket, keys[i], Config=transfer_config)
+        return size, False
+
+    results = [None] * len(call_urls)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(worker, i): i for i in range(len(call_urls))}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                size, skipped = future.result()
+                results[i] = {'call': call_urls[i], 'key': keys[i], 'bytes': size, 'skipped': skipped, 'error': None}
+            except Exception as e:
+                print(f"Failed to upload {keys[i]} to {bucket}: {e}")
+                results[i] = {'call': call_urls[i], 'key': None, 'bytes': 0, 'skipped': False, 'error': str(e)}
+    report_throughput('Uploaded', [r for r in results if not r['skipped']], time.monotonic() - start)
+    print(f"{sum(1 for r in results if r['skipped'])} recordings were already in s3")
+    return results
+
+
+class BufferPool:
+    """
+    A fixed set of reusable part-sized buffers. Streams block on acquire() when all the
+    buffers are in use, so memory stays at pool_size * part_size however many workers run
+    (parts go to s3 straight from the buffer, see BufferReader).
+    """
+
+    def __init__(self, pool_size, part_size=S3_PART_SIZE):
+        self.part_size = part_size
+        self._buffers = queue.Queue()
+        for _ in range(pool_size):
+            self._buffers.put(bytearray(part_size))
+
+    def acquire(self):
+        return self._buffers.get()
+
+    def release(self, buffer):
+        self._buffers.put(buffer)
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Read-only, seekable file object over a memoryview, so a part in a pooled buffer can be handed to
+    s3 as the Body without copying it into a bytes object first. botocore reads it in chunks (for the
+    checksum and to send it) and seeks back to retry.
+    """
+
+    def __init__(self, view):
+        self.view = view
+        self.pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = max(0, min(len(b), len(self.view) - self.pos))
+        b[:n] = self.view[self.pos:self.pos + n]
+        self.pos += n
+        return n
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.pos, io.SEEK_END: len(self.view)}[whence]
+        self.pos = max(0, base + offset)
+        return self.pos
+
+    def tell(self):
+        return self.pos
+
+
+def _fill_buffer(raw, view):
+    """
+    Reads from the raw response into view until it is full or the response ends.
+    Returns the number of bytes read.
+    """
+    filled = 0
+    while filled < len(view):
+        n = raw.readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+def stream_recording_to_s3(url, bucket, key, session, s3, buffer_pool, host_limiter, max_retries=3, backoff=1.0,
+                           resolver=None):
+    """
+    Pipes a recording straight from the source into S3 without touching local disk.
+    The mp3 url comes from resolver, as in fetch_recording.
+    Recordings smaller than one part go up with a single put_object, bigger ones as a
+    multipart upload, one pooled buffer at a time.
+    Args:
+        url (str): The URL of the page containing the MP3 resource.
+        bucket (str): destination bucket
+        key (str): destination key
+    Returns:
+        (int, str): size of the recording in bytes and its sha256, computed as it streams through.
+    """
+    if resolver is None:
+        resolver = get_recording_url_resolver()
+    mp3_url = resolver.resolve(url, session, host_limiter)
+    buffer = buffer_pool.acquire()
+    view = memoryview(buffer)
+    try:
+        for refreshed in (False, True):
+            if refreshed:
+                # the resolved mp3 url has expired, get a fresh one from the page
+                mp3_url = resolver.resolve(url, session, host_limiter, refresh=True)
+            with host_limiter(mp3_url):
+                try:
+                    mp3_response = _get_with_retries(session, mp3_url, max_retries, backoff, stream=True)
+                except requests.HTTPError as e:
+                    if not refreshed and e.response is not None and e.response.status_code in STALE_RECORDING_STATUS_CODES:
+                        continue
+                    raise
+                try:
+                    mp3_response.raw.decode_content = True
+                    hasher = hashlib.sha256()
+                    n = _fill_buffer(mp3_response.raw, view)
+                    hasher.update(view[:n])
+                    if n < len(view):
+                        s3.put_object(Bucket=bucket, Key=key, Body=BufferReader(view[:n]))
+                        return n, hasher.hexdigest()
+                    upload_id = s3.create_multipart_upload(Bucket=bucket, Key=key)['UploadId']
+                    try:
+                        parts = []
+                        total = 0
+                        while n:
+                            part_number = len(parts) + 1
+                            resp = s3.upload_part(Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number,
+                                                  Body=BufferReader(view[:n]))
+                            parts.append({'ETag': resp['ETag'], 'PartNumber': part_number})
+                            total += n
+                            n = _fill_buffer(mp3_response.raw, view)
+                            hasher.update(view[:n])
+                        s3.complete_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id,
+                                                     MultipartUpload={'Parts': parts})
+                        return total, hasher.hexdigest()
+                    except Exception:
+                        s3.abort_multipart_upload(Bucket=bucket, Key=key, UploadId=upload_id)
+                        raise
+                finally:
+                    mp3_response.close()
+    finally:
+        view.release()
+        buffer_pool.release(buffer)
+
+
+def stream_recordings_to_s3(call_urls, bucket, max_workers=16, per_host_limit=8, part_size=S3_PART_SIZE,
+                            pool_size=None, max_retries=3, backoff=1.0, s3=None):
+    """
+    Streams the recordings for the calls returned by get_call_urls into s3://bucket/<recording_key>,
+    the same keys upload_recordings uses for mp3-downloads/.
+    Returns:
+        list: one dict per call, in the same order as call_urls, with the uploaded 'key'
+        (None on failure), the 'bytes' streamed, the recording's 'sha256' and the 'error' if there was one.
+    """
+    if s3 is None:
+        s3 = get_client('s3', 'us-east-1')
+    buffer_pool = BufferPool(pool_size or max_workers, part_size)
+    local = threading.local()
+    host_limiter = HostLimiter(per_host_limit)
+    resolver = get_recording_url_resolver()
+    resolver.prefetch([call_url['url'] for call_url in call_urls], host_limiter)
+
+    def worker(call_url):
+        if not hasattr(local, 'session'):
+            local.session = make_http_session(per_host_limit)
+        key = recording_key(call_url)
+        size, content_hash = stream_recording_to_s3(call_url['url'], bucket, key, local.session, s3, buffer_pool,
+                                                    host_limiter, max_retries, backoff, resolver)
+        return key, size, content_hash
+
+    results = [None] * len(call_urls)
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(worker, call_url): i for i, call_url in enumerate(call_urls)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                key, size, content_hash = future.result()
+                results[i] = {'call': call_urls[i], 'key': key, 'bytes': size, 'sha256': content_hash, 'error': None}
+            except Exception as e:
+                print(f"Failed to stream {call_urls[i]['url']} to s3: {e}")
+                results[i] = {'call': call_urls[i], 'key': None, 'bytes': 0, 'sha256': None, 'error': str(e)}
+    report_throughput('Streamed', results, time.monotonic() - start)
+    return results
+
+
 # # Example usage
 # original_url = "https://admins.callerready.com/Recordings/Recording?AccountSid=AC3951a31053e8b50054f86fa930d61eb6&RecordingSid=RE5f8b4ce0a74338da9a21e7bc0d4720b8"
 # save_path = "downloads-new/mp3file.mp3"
@@ -131,44 +861,60 @@ def download_mp3_from_html(url, save_path):
 #     download_mp3_from_html(call_url, save_path)
 #
 
-def construct_transcript_turns(speech_data):
+def iter_transcript_turns(speech_data):
     """
-    need to pass in transcript_json['results']['items']
+    Yields the speaker turns as soon as each one ends, so speech_data can be a stream of items
+    (see iter_transcript_items) and only the current turn's words are held at once.
+    Items without a speaker_label (punctuation sometimes) stay with the current speaker.
     """
-    turns = []
     current_speaker = None
     current_content = []
     for item in speech_data:
-        speaker = item['speaker_label']
+        speaker = item.get('speaker_label', current_speaker)
         word = item['alternatives'][0]['content']
         if speaker != current_speaker:
             if current_speaker is not None:
-                turns.append({'speaker': current_speaker, 'content': ' '.join(current_content)})
+                yield {'speaker': current_speaker, 'content': ' '.join(current_content)}
             current_speaker = speaker
             current_content = [word]
         else:
             current_content.append(word)
     # Add the last turn
     if current_speaker is not None:
-        turns.append({'speaker': current_speaker, 'content': ' '.join(current_content)})
-    return turns
-
-def load_files_from_bucket_and_prefix(bucket, prefix):
-    # # use boto3 s3 client to list all files in s3://synergy-sandbox-905418409497/test-transcribe-automation/
-    s3 = boto3.client('s3')
-    response = s3.list_objects_v2(Bucket=bucket, Prefix=prefix)
-    keys = []
-    for obj in response.get('Contents', []):
-        keys.append(obj['Key'])
-    # now for each key, download the json file and load it into a variable
-    # then extract the speaker turns
-    objection_scores = []
-    for key in keys:
-        response = s3.get_object(Bucket=bucket, Key=key)
-        data = json.loads(response['Body'].read())
-        # Construct transcript turns
-        objection_scores.append(data)
-    return objection_scores
+        yield {'speaker': current_speaker, 'content': ' '.join(current_content)}
+
+
+def construct_transcript_turns(speech_data):
+    """
+    need to pass in transcript_json['results']['items']
+    """
+    return list(iter_transcript_turns(speech_data))
+
+def list_objects(bucket, prefix, s3):
+    """
+    Every object under prefix, following the pagination (list_objects_v2 stops at 1000 keys a page).
+    """
+    objects = []
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=prefix):
+        objects += page.get('Contents', [])
+    return objects
+
+
+def load_files_from_bucket_and_prefix(bucket, prefix, s3=None, max_workers=32):
+    """
+    Loads every json object under s3://bucket/prefix, fetching them concurrently over one client.
+    Returns:
+        list: the parsed objects, in key order.
+    """
+    if s3 is None:
+        s3 = get_client('s3')
+    keys = [obj['Key'] for obj in list_objects(bucket, prefix, s3)]
+    results = run_ordered(lambda key: json.loads(s3.get_object(Bucket=bucket, Key=key)['Body'].read()), keys,
+                          max_workers=max_workers)
+    for result in results:
+        if result['error'] is not None:
+            raise result['error']
+    return [result['result'] for result in results]
 
 # read transcript into speaker turns
 
@@ -185,9 +931,8 @@ for turn in transcript_turns:
 # bucket_name = 'synergy-sandbox-905418409497'
 # object_key = 'sample-data-callerready/Call Log Advanced 4_1 4_15.csv'
 def fetch_call_log(bucket_name, object_key):
-    s3 = boto3.resource('s3')
-    obj = s3.Object(bucket_name, object_key)
-    data = obj.get()['Body'].read()
+    s3 = get_client('s3')
+    data = s3.get_object(Bucket=bucket_name, Key=object_key)['Body'].read()
     # put into a df
     df = pd.read_csv(io.BytesIO(data), low_memory=False)
     return df
@@ -228,8 +973,87 @@ def get_call_urls(df, duration_threshold=20):
     return call_urls
 
 
-def start_transcription_job(job_name, media_s3_uri, output_bucket, output_key):
-    transcribe_client = boto3.client('transcribe', region_name='us-east-1')  # check bucket region
+# the only call log columns anything reads, and their types. date columns (any column with the word
+# 'date' in its name, e.g. 'Call Date') are read too, as strings, and the first one gives each call its 'date'
+CALL_LOG_COLUMNS = {
+    'Recording': str,
+    'Conference Time (seconds)': 'float64',
+    'TrackingGuid': str,
+}
+# who took the call, if the log has it; carried through to the score rows for aggregate_scores' by_agent
+CALL_LOG_AGENT_COLUMN = 'Agent'
+CALL_LOG_CHUNK_ROWS = 100000
+
+
+def is_call_log_date_column(name):
+    # the whole word (call_date, Date_Time, callDate and DateTime count), so 'Last Updated' or
+    # 'Candidate' aren't taken for dates. camelCase is split into words first
+    words = re.sub(r'(?<=[a-z0-9])(?=[A-Z])', ' ', name)
+    return re.search(r'(?<![a-z])date(?![a-z])', words, re.IGNORECASE) is not None
+
+
+def iter_call_log(bucket_name, object_key, duration_threshold=20, chunksize=CALL_LOG_CHUNK_ROWS, s3=None,
+                  agent_column=CALL_LOG_AGENT_COLUMN, date_format=None):
+    """
+    Streams the call log csv from s3 a chunk of rows at a time, parsing only the columns in
+    CALL_LOG_COLUMNS, agent_column and the date columns, and yields the calls longer than
+    duration_threshold as they're read, so memory doesn't grow with the size of the log.
+    Dates are parsed with date_format, or if that's None with the format of the first date in the
+    log, so every chunk is read the same way. How many didn't parse is printed at the end.
+    Yields:
+        dict: the same 'url', 'duration' and 'tracking_guid' as get_call_urls, plus 'date'
+        (YYYY-MM-DD, or None if the log has no date column or the date doesn't parse) and 'agent'
+        (None if the log has no agent_column).
+    """
+    if s3 is None:
+        s3 = get_client('s3')
+    body = s3.get_object(Bucket=bucket_name, Key=object_key)['Body']
+    dates_seen = dates_missed = 0
+    try:
+        reader = pd.read_csv(body, usecols=lambda c: (c in CALL_LOG_COLUMNS or c == agent_column
+                                                      or is_call_log_date_column(c)),
+                             dtype=collections.defaultdict(lambda: str, CALL_LOG_COLUMNS), chunksize=chunksize)
+        for chunk in reader:
+            chunk = chunk[chunk['Conference Time (seconds)'] > duration_threshold]
+            if chunk.empty:
+                continue
+            date_columns = [c for c in chunk.columns if c not in CALL_LOG_COLUMNS and c != agent_column]
+            if date_columns:
+                raw = chunk[date_columns[0]]
+                if date_format is None and raw.notna().any():
+                    # 'mixed' parses each value on its own if the first one isn't a format pandas knows
+                    date_format = guess_datetime_format(raw[raw.notna()].iloc[0]) or 'mixed'
+                dates = pd.to_datetime(raw, format=date_format, errors='coerce')
+                dates_seen += int(raw.notna().sum())
+                dates_missed += int((raw.notna() & dates.isna()).sum())
+                dates = dates.dt.strftime('%Y-%m-%d')
+                dates = dates.astype(object).where(dates.notna(), None).tolist()
+            else:
+                dates = [None] * len(chunk)
+            if agent_column in chunk.columns:
+                agents = chunk[agent_column].astype(object).where(chunk[agent_column].notna(), None).tolist()
+            else:
+                agents = [None] * len(chunk)
+            for url, duration, tracking_guid, date, agent in zip(chunk['Recording'].tolist(),
+                                                                 chunk['Conference Time (seconds)'].tolist(),
+                                                                 chunk['TrackingGuid'].tolist(), dates, agents):
+                yield {
+                    'url': url,
+                    'duration': duration,
+                    'tracking_guid': tracking_guid,
+                    'date': date,
+                    'agent': agent,
+                }
+        if dates_missed:
+            print(f"{dates_missed} of {dates_seen} call log dates didn't parse as {date_format!r}, "
+                  f"those calls go under date={NO_DATE_PARTITION}")
+    finally:
+        body.close()
+
+
+def start_transcription_job(job_name, media_s3_uri, output_bucket, output_key, transcribe_client=None):
+    if transcribe_client is None:
+        transcribe_client = get_client('transcribe', 'us-east-1')  # check bucket region
     return transcribe_client.start_transcription_job(
         TranscriptionJobName=job_name,
         Media={
@@ -252,7 +1076,7 @@ def start_transcription_job(job_name, media_s3_uri, output_bucket, output_key):
 
 # automatically flags categories
 def start_call_analytics_job(job_name, input_media_uri, output_bucket):
-    transcribe_client = boto3.client('transcribe', region_name='us-east-1')  # check bucket region
+    transcribe_client = get_client('transcribe', 'us-east-1')  # check bucket region
     return transcribe_client.start_call_analytics_job(
         CallAnalyticsJobName=job_name,
         Settings={
@@ -278,6 +1102,582 @@ def start_call_analytics_job(job_name, input_media_uri, output_bucket):
 {'CallAnalyticsJob': {'CallAnalyticsJobName': 'REe4229b1e1f87f6fde4b5fbced6ba7d2a', 'CallAnalyticsJobStatus': 'IN_PROGRESS', 'Media': {'MediaFileUri': 's3://synergy-sandbox-us-east-1-905418409497/mp3-downloads/REe4229b1e1f87f6fde4b5fbced6ba7d2a.mp3'}, 'StartTime': datetime.datetime(2024, 5, 16, 17, 1, 51, 393000, tzinfo=tzlocal()), 'CreationTime': datetime.datetime(2024, 5, 16, 17, 1, 51, 363000, tzinfo=tzlocal()), 'DataAccessRoleArn': 'arn:aws:iam::905418409497:role/service-role/AmazonTranscribeServiceRole-my-transcribe-role', 'Settings': {'LanguageOptions': ['en-US']}, 'ChannelDefinitions': [{'ChannelId': 0, 'ParticipantRole': 'AGENT'}, {'ChannelId': 1, 'ParticipantRole': 'CUSTOMER'}]}, 'ResponseMetadata': {'RequestId': '71877087-cc17-46a8-beab-a34fa9803b14', 'HTTPStatusCode': 200, 'HTTPHeaders': {'x-amzn-requestid': '71877087-cc17-46a8-beab-a34fa9803b14', 'content-type': 'application/x-amz-json-1.1', 'content-length': '570', 'date': 'Thu, 16 May 2024 22:01:50 GMT'}, 'RetryAttempts': 0}}
 """
 
+
+def is_client_error(e, *codes):
+    # botocore ClientError with one of the given error codes?
+    return isinstance(e, ClientError) and e.response.get('Error', {}).get('Code') in codes
+
+
+def is_transient_error(e):
+    # a 5xx or a dropped/timed out connection, worth trying again
+    if isinstance(e, ClientError):
+        return e.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0) >= 500
+    return isinstance(e, (BotoConnectionError, HTTPClientError))
+
+
+def call_with_retries(fn, max_retries=3, backoff=1.0, sleep=time.sleep):
+    """
+    fn(), retrying transient errors (is_transient_error) with jittered exponential backoff. For the
+    clients in AWS_RETRIES, which botocore doesn't retry.
+    """
+    attempt = 0
+    while True:
+        try:
+            return fn()
+        except Exception as e:
+            if not is_transient_error(e) or attempt >= max_retries:
+                raise
+        attempt += 1
+        sleep(backoff * (2 ** (attempt - 1)) * (1 + random.random()))
+
+
+def s3_https_uri(bucket, key, region='us-east-1'):
+    # the format transcribe uses for TranscriptFileUri, which download_transcription expects
+    return f"https://s3.{region}.amazonaws.com/{bucket}/{key}"
+
+
+class TranscriptionJobTracker:
+    """
+    Waits for a set of transcription jobs by listing finished jobs in bulk
+    (list_transcription_jobs filtered by status and name, 100 per page) instead of
+    calling get_transcription_job for every outstanding job on every pass.
+
+    The wait between polls adapts: with N jobs pending and jobs expected to take
+    expected_job_seconds, one completes roughly every expected_job_seconds / N, so that's
+    the base interval. It is stretched by 1.5x for each poll that finds nothing new, and
+    expected_job_seconds itself is re-estimated from the jobs that have finished.
+
+    Jobs are listed newest first, so paging stops once it's past the oldest pending job's
+    CreationTime. add() needs that time to stop early; while any pending job's is unknown
+    (e.g. a job started by an earlier run that didn't record it) every page is read.
+    Args:
+        transcribe: a transcribe client (or LocalClients.LocalTranscribeClient)
+        name_contains (str): passed as JobNameContains, e.g. the batch_id
+    """
+    PAGE_SIZE = 100
+
+    def __init__(self, transcribe, name_contains=None, expected_job_seconds=120, min_interval=5,
+                 max_interval=60, sleep=time.sleep, clock=time.monotonic):
+        self.transcribe = transcribe
+        self.name_contains = name_contains
+        self.expected_job_seconds = expected_job_seconds
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.sleep = sleep
+        self.clock = clock
+        self.pending = {}  # job name -> time added
+        self.created = {}  # job name -> CreationTime, None if unknown
+        self.empty_polls = 0
+        self.api_calls = 0
+
+    def add(self, job_name, created=None):
+        """
+        Args:
+            created: the job's CreationTime (a datetime or an isoformat string), if known.
+        """
+        if isinstance(created, str):
+            created = datetime.datetime.fromisoformat(created)
+        self.pending[job_name] = self.clock()
+        self.created[job_name] = created
+
+    def _listing_cutoff(self):
+        # a few minutes' slack for clock differences
+        if not self.created or None in self.created.values():
+            return None
+        return min(self.created.values()) - datetime.timedelta(minutes=5)
+
+    def _list_finished(self, status):
+        kwargs = {'Status': status, 'MaxResults': self.PAGE_SIZE}
+        if self.name_contains:
+            kwargs['JobNameContains'] = self.name_contains
+        while True:
+            response = call_with_retries(lambda: self.transcribe.list_transcription_jobs(**kwargs), sleep=self.sleep)
+            self.api_calls += 1
+            summaries = response.get('TranscriptionJobSummaries', [])
+            for summary in summaries:
+                yield summary
+            if 'NextToken' not in response or not self.pending:
+                return
+            oldest = summaries[-1].get('CreationTime') if summaries else None
+            cutoff = self._listing_cutoff()
+            if oldest is not None and cutoff is not None and oldest < cutoff:
+                return
+            kwargs['NextToken'] = response['NextToken']
+
+    def poll(self):
+        """
+        One pass over the finished jobs. Returns the summaries of pending jobs that are now
+        COMPLETED or FAILED and stops tracking them.
+        """
+        done = []
+        for status in ('COMPLETED', 'FAILED'):
+            if not self.pending:
+                break
+            for summary in self._list_finished(status):
+                name = summary['TranscriptionJobName']
+                if name in self.pending:
+                    added = self.pending.pop(name)
+                    self.created.pop(name, None)
+                    # moving average of how long jobs take
+                    self.expected_job_seconds = 0.8 * self.expected_job_seconds + 0.2 * (self.clock() - added)
+                    done.append(summary)
+        self.empty_polls = 0 if done else self.empty_polls + 1
+        return done
+
+    def next_interval(self):
+        if not self.pending:
+            return 0
+        return self.next_interval_for(len(self.pending))
+
+    def next_interval_for(self, num_pending):
+        interval = self.expected_job_seconds / num_pending * (1.5 ** self.empty_polls)
+        return max(self.min_interval, min(self.max_interval, interval))
+
+    def iter_completed(self):
+        """
+        Yields each job summary as soon as a poll finds it finished, until nothing is pending.
+        """
+        while self.pending:
+            for summary in self.poll():
+                yield summary
+            if self.pending:
+                self.sleep(self.next_interval())
+
+
+# transcribe's default quota is 100-250 concurrent batch jobs depending on the region, and other
+# work in the account shares it
+MAX_TRANSCRIPTION_JOBS = 100
+START_RETRY_CODES = ('LimitExceededException', 'ThrottlingException', 'TooManyRequestsException')
+# how many transcription jobs a call gets before it's left as job_failed
+MAX_TRANSCRIPTION_ATTEMPTS = 3
+
+
+def transcription_job_name(sid, batch_id, attempt=0):
+    # transcribe won't take a job name twice, so a call resubmitted after its job failed gets a
+    # new one. it still ends in -<batch_id>, see list_batch_job_names
+    return f"{sid}-{batch_id}" if not attempt else f"{sid}-r{attempt}-{batch_id}"
+
+
+def start_backoff(attempt, backoff=2.0, max_backoff=60):
+    # exponential, with jitter so refused starts don't all come back at once
+    return min(max_backoff, backoff * (2 ** (attempt - 1))) * (1 + random.random())
+
+
+def job_creation_time(response):
+    """
+    The CreationTime from a start_transcription_job response as an isoformat string (to keep in
+    BatchStateStore and hand to TranscriptionJobTracker.add), or now if the response doesn't say.
+    """
+    created = response.get('TranscriptionJob', {}).get('CreationTime')
+    return (created or datetime.datetime.now(datetime.timezone.utc)).isoformat()
+
+
+class TranscriptionJobScheduler:
+    """
+    Starts transcription jobs without going over the concurrent job quota: at most max_in_flight
+    run at once, the rest wait in a queue and are started as the TranscriptionJobTracker sees
+    running ones finish. Queued jobs start longest recording first (duration from the call log), so
+    a long call isn't left running on its own at the end of the batch.
+    A start refused for throttling goes back on the queue and starting pauses for a jittered,
+    growing backoff. A LimitExceeded while jobs are running means the real quota is lower (other
+    work in the account is using some of it), so max_in_flight drops to what's running and creeps
+    back up by one per finished job.
+    Args:
+        transcribe: a transcribe client (or LocalClients.LocalTranscribeClient)
+        name_contains (str): passed on to the tracker, e.g. the batch_id
+        on_start: called with each job (the dict add() made) once it has been started.
+    """
+
+    def __init__(self, transcribe, max_in_flight=MAX_TRANSCRIPTION_JOBS, name_contains=None, longest_first=True,
+                 on_start=None, max_retries=8, backoff=2.0, max_backoff=60, tracker=None, sleep=time.sleep,
+                 clock=time.monotonic):
+        self.transcribe = transcribe
+        self.limit = max_in_flight
+        self.max_in_flight = max_in_flight
+        self.longest_first = longest_first
+        self.on_start = on_start
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+        self.clock = clock
+        self.tracker = tracker or TranscriptionJobTracker(transcribe, name_contains, sleep=sleep, clock=clock)
+        self.queue = []  # heap of (-duration, order added, job)
+        self.started = {}  # job name -> job
+        self.retry_at = None
+        self.added = 0
+        self.starts = 0
+        self.rejected = 0
+
+    def add(self, job_name, media_s3_uri, output_bucket, output_key, duration=0, **info):
+        """
+        Queues a job. Anything in info is kept on the job dict handed back by run() and on_start.
+        """
+        job = {'job_name': job_name, 'media_s3_uri': media_s3_uri, 'output_bucket': output_bucket,
+               'output_key': output_key, 'duration': duration, 'attempts': 0, **info}
+        priority = -(duration or 0) if self.longest_first else 0
+        self.added += 1
+        heapq.heappush(self.queue, (priority, self.added, job))
+        return job
+
+    def track(self, job_name, created=None):
+        # a job that's already running, e.g. started by a previous run; created as for TranscriptionJobTracker.add
+        if job_name not in self.tracker.pending:
+            self.tracker.add(job_name, created)
+
+    def start_ready(self):
+        """
+        Starts queued jobs while there's room. Returns (job, summary) for jobs that can't be started.
+        """
+        failed = []
+        while self.queue and len(self.tracker.pending) < self.max_in_flight:
+            if self.retry_at is not None and self.clock() < self.retry_at:
+                break
+            job = self.queue[0][2]
+            job['created'] = None
+            try:
+                response = start_transcription_job(job['job_name'], job['media_s3_uri'], job['output_bucket'],
+                                                   job['output_key'], transcribe_client=self.transcribe)
+                job['created'] = job_creation_time(response)
+                self.starts += 1
+            except (ClientError, BotoConnectionError, HTTPClientError) as e:
+                if is_client_error(e, 'LimitExceededException') and self.tracker.pending:
+                    # wait for a running job to finish rather than backing off
+                    self.rejected += 1
+                    self.max_in_flight = len(self.tracker.pending)
+                    break
+                if (is_client_error(e, *START_RETRY_CODES) or is_transient_error(e)) and job['attempts'] < self.max_retries:
+                    self.rejected += 1
+                    job['attempts'] += 1
+                    self.retry_at = self.clock() + start_backoff(job['attempts'], self.backoff, self.max_backoff)
+                    break
+                if not is_client_error(e, 'ConflictException'):
+                    heapq.heappop(self.queue)
+                    failed.append((job, {'TranscriptionJobName': job['job_name'], 'TranscriptionJobStatus': 'FAILED',
+                                         'FailureReason': f'could not start the job: {e}'}))
+                    continue
+                # otherwise a previous run got as far as starting it
+            heapq.heappop(self.queue)
+            self.retry_at = None
+            self.started[job['job_name']] = job
+            self.tracker.add(job['job_name'], job['created'])
+            if self.on_start:
+                self.on_start(job)
+        return failed
+
+    def retry_wait(self):
+        # seconds until a start that was refused can be tried again, None if nothing is waiting on one
+        if self.retry_at is None or not self.queue or len(self.tracker.pending) >= self.max_in_flight:
+            return None
+        return max(0, self.retry_at - self.clock())
+
+    def _next_wait(self):
+        waits = []
+        if self.tracker.pending:
+            waits.append(self.tracker.next_interval())
+        if self.retry_wait() is not None:
+            waits.append(self.retry_wait())
+        return min(waits)
+
+    def poll(self):
+        """
+        One tracker poll. Returns (job, summary) for the jobs that have finished since the last one.
+        """
+        finished = []
+        for summary in self.tracker.poll():
+            finished.append((self.started.pop(summary['TranscriptionJobName'], None), summary))
+            self.max_in_flight = min(self.limit, self.max_in_flight + 1)
+        return finished
+
+    def run(self):
+        """
+        Starts the queued jobs and yields (job, summary) for each as it finishes, starting more as
+        room frees up, until nothing is queued or running. job is None for jobs given to track().
+        Jobs that couldn't be started at all come back with a FAILED summary.
+        """
+        while self.queue or self.tracker.pending:
+            finished = self.start_ready()
+            if self.tracker.pending:
+                finished += self.poll()
+            for job, summary in finished:
+                yield job, summary
+            if not finished and (self.queue or self.tracker.pending):
+                self.sleep(self._next_wait())
+
+
+# where each call of a batch has got to, so a rerun picks up where the last one stopped. job_failed
+# is uploaded, but its transcription job failed (see BatchStateStore.job_failed), so it's started again
+CALL_STAGES = ['downloaded', 'uploaded', 'job_failed', 'job_started', 'transcribed', 'scored', 'written']
+
+
+class BatchStateStore:
+    """
+    Local sqlite record of the stage every call in a batch has reached, keyed by
+    (batch_id, tracking_guid). Stages only move forward, apart from job_failed. Anything else worth
+    keeping for a restart (job name, output key, the scoring responses...) is stored alongside as json.
+    Also holds the content-hash index of recordings (lookup_audio / record_audio).
+    Safe to share between threads.
+    """
+
+    def __init__(self, path='batch-state.db'):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS calls (
+                batch_id TEXT NOT NULL,
+                tracking_guid TEXT NOT NULL,
+                stage TEXT NOT NULL,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (batch_id, tracking_guid)
+            )""")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS audio (
+                content_hash TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )""")
+        self._conn.commit()
+
+    def get(self, batch_id, tracking_guid):
+        """
+        Returns:
+            dict: the call's saved fields plus 'stage', or None if the call hasn't been seen.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT stage, data FROM calls WHERE batch_id = ? AND tracking_guid = ?',
+                                     (batch_id, str(tracking_guid))).fetchone()
+        if row is None:
+            return None
+        return {**json.loads(row[1]), 'stage': row[0]}
+
+    def advance(self, batch_id, tracking_guid, stage, **fields):
+        """
+        Records that the call has reached stage (never moving it backwards) and saves fields with it.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT stage, data FROM calls WHERE batch_id = ? AND tracking_guid = ?',
+                                     (batch_id, str(tracking_guid))).fetchone()
+            data = {}
+            if row is not None:
+                data = json.loads(row[1])
+                if CALL_STAGES.index(row[0]) > CALL_STAGES.index(stage):
+                    stage = row[0]
+            data.update(fields)
+            self._conn.execute('INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?)',
+                               (batch_id, str(tracking_guid), stage, json.dumps(data), time.time()))
+            self._conn.commit()
+
+    def job_failed(self, batch_id, tracking_guid, failure_reason=None):
+        """
+        Moves a call at job_started back to job_failed, so the next run starts it again under a new job
+        name (transcription_job_name with the call's job_attempts). Calls that have got further are left alone.
+        Returns:
+            int: the number of jobs the call has had fail, or None if it wasn't at job_started.
+        """
+        with self._lock:
+            row = self._conn.execute('SELECT stage, data FROM calls WHERE batch_id = ? AND tracking_guid = ?',
+                                     (batch_id, str(tracking_guid))).fetchone()
+            if row is None or row[0] != 'job_started':
+                return None
+            data = json.loads(row[1])
+            data['job_attempts'] = data.get('job_attempts', 0) + 1
+            data['failure_reason'] = failure_reason
+            data['failed_job_name'] = data.pop('job_name', None)
+            data.pop('job_created', None)
+            self._conn.execute('INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?)',
+                               (batch_id, str(tracking_guid), 'job_failed', json.dumps(data), time.time()))
+            self._conn.commit()
+        return data['job_attempts']
+
+    def calls(self, batch_id, stage=None):
+        """
+        All the calls of a batch (only those currently at stage, if given), as get() returns them.
+        """
+        query = 'SELECT tracking_guid, stage, data FROM calls WHERE batch_id = ?'
+        params = [batch_id]
+        if stage is not None:
+            query += ' AND stage = ?'
+            params.append(stage)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [{**json.loads(data), 'tracking_guid': guid, 'stage': stage} for guid, stage, data in rows]
+
+    # content-addressed index over uploaded audio: the sha256 of a recording maps to the
+    # transcription job / transcript / scores already produced for it, in any batch
+
+    def lookup_audio(self, content_hash):
+        """
+        Returns:
+            dict: what's known about this recording (job_name, output_key, transcript_uri,
+            responses...), or None if it has never been seen.
+        """
+        if not content_hash:
+            return None
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM audio WHERE content_hash = ?', (content_hash,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record_audio(self, content_hash, **fields):
+        if not content_hash:
+            return
+        with self._lock:
+            row = self._conn.execute('SELECT data FROM audio WHERE content_hash = ?', (content_hash,)).fetchone()
+            data = json.loads(row[0]) if row else {}
+            data.update(fields)
+            self._conn.execute('INSERT OR REPLACE INTO audio VALUES (?, ?, ?)',
+                               (content_hash, json.dumps(data), time.time()))
+            self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+
+def reached(record, stage):
+    # has this state store record got to stage (or further)?
+    return record is not None and CALL_STAGES.index(record['stage']) >= CALL_STAGES.index(stage)
+
+
+# streaming pipeline plumbing: stages are thread pools connected by bounded queues
+PIPELINE_DONE = object()
+
+
+def start_pipeline_stage(name, fn, in_queue, out_queue, workers=1, errors=None):
+    """
+    Starts `workers` threads that take items off in_queue, call fn(item) and put the result
+    on out_queue. A None result drops the item; so does an exception, which is printed and
+    appended to errors as (name, item, exception) if given. Once every worker has seen
+    PIPELINE_DONE it is passed on to out_queue.
+    Returns:
+        list: the started threads
+    """
+    remaining = [workers]
+    lock = threading.Lock()
+
+    def work():
+        while True:
+            item = in_queue.get()
+            if item is PIPELINE_DONE:
+                # put it back so the other workers of this stage see it too
+                in_queue.put(PIPELINE_DONE)
+                with lock:
+                    remaining[0] -= 1
+                    last = remaining[0] == 0
+                if last:
+                    out_queue.put(PIPELINE_DONE)
+                return
+            try:
+                result = fn(item)
+            except Exception as e:
+                print(f"{name} failed: {e}")
+                if errors is not None:
+                    errors.append((name, item, e))
+                result = None
+            if result is not None:
+                out_queue.put(result)
+
+    threads = [threading.Thread(target=work, name=f'{name}-{i}', daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def start_transcription_stage(scheduler, in_queue, out_queue):
+    """
+    Pipeline stage around a TranscriptionJobScheduler. Items are dicts holding the 'job_name':
+    those that also have a 'media_s3_uri' (plus 'output_bucket', 'output_key' and 'duration') still
+    need their job started and are queued on the scheduler, so no more than its max_in_flight run at
+    once; the rest are jobs that were already started (e.g. by an earlier run) and are only tracked,
+    with their 'job_created' (see job_creation_time) if they have one. Items are passed on, with
+    'job_status' and 'failure_reason' set, as soon as a poll finds their job finished (or couldn't
+    start it), and straight away if they already have a 'job_status'. Polls happen on the tracker's
+    adaptive interval however fast items come in.
+    The items waiting on a job are the 'items' list of the job the scheduler's on_start gets. An item
+    with the same 'content_hash' as one whose job is queued or running here waits on that job instead.
+    """
+    tracker = scheduler.tracker
+
+    def work():
+        items = {}  # job name -> the items waiting on it
+        jobs = {}  # job name -> job, for the jobs queued here
+        by_hash = {}  # content hash -> job name
+        upstream_done = False
+        next_poll_at = None
+
+        def finish(finished):
+            for _, summary in finished:
+                jobs.pop(summary['TranscriptionJobName'], None)
+                for item in items.pop(summary['TranscriptionJobName'], []):
+                    item['job_status'] = summary['TranscriptionJobStatus']
+                    item['failure_reason'] = summary.get('FailureReason')
+                    out_queue.put(item)
+
+        while not upstream_done or scheduler.queue or tracker.pending:
+            waits = [scheduler.retry_wait()]
+            if tracker.pending:
+                if next_poll_at is None:
+                    next_poll_at = tracker.clock() + tracker.next_interval()
+                waits.append(max(0, next_poll_at - tracker.clock()))
+            waits = [wait for wait in waits if wait is not None]
+            timeout = min(waits) if waits else None
+            if upstream_done and timeout is None:
+                # queued jobs that can't start until something finishes, and nothing is running
+                timeout = tracker.min_interval
+            try:
+                item = None if upstream_done else in_queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if upstream_done and timeout:
+                scheduler.sleep(timeout)
+            # take everything that has arrived in the meantime
+            while item is not None:
+                if item is PIPELINE_DONE:
+                    upstream_done = True
+                elif item.get('job_status'):
+                    # already finished (e.g. in an earlier run), nothing to wait for
+                    out_queue.put(item)
+                else:
+                    if not tracker.pending:
+                        next_poll_at = tracker.clock() + tracker.next_interval_for(1)
+                    job_name = item['job_name']
+                    shared = by_hash.get(item.get('content_hash')) if item.get('media_s3_uri') else None
+                    if shared in items:
+                        # the same recording as a call that's already queued or running, share its job
+                        job = jobs[shared]
+                        item['job_name'], item['output_key'] = job['job_name'], job['output_key']
+                        items[shared].append(item)
+                        if shared in scheduler.started and scheduler.on_start:
+                            scheduler.on_start({**job, 'items': [item]})
+                    elif job_name in items:
+                        items[job_name].append(item)
+                    elif item.get('media_s3_uri'):
+                        items[job_name] = [item]
+                        jobs[job_name] = scheduler.add(job_name, item['media_s3_uri'], item['output_bucket'],
+                                                       item['output_key'], duration=item.get('duration') or 0,
+                                                       items=items[job_name])
+                        if item.get('content_hash'):
+                            by_hash[item['content_hash']] = job_name
+                    else:
+                        items[job_name] = [item]
+                        scheduler.track(job_name, item.get('job_created'))
+                try:
+                    item = None if upstream_done else in_queue.get_nowait()
+                except queue.Empty:
+                    item = None
+            finish(scheduler.start_ready())
+            if tracker.pending and next_poll_at is not None and tracker.clock() >= next_poll_at:
+                finish(scheduler.poll())
+                # room may have freed up
+                finish(scheduler.start_ready())
+                next_poll_at = tracker.clock() + tracker.next_interval()
+        out_queue.put(PIPELINE_DONE)
+
+    thread = threading.Thread(target=work, name='transcribe', daemon=True)
+    thread.start()
+    return [thread]
+
 #
 # # start the transcription job with each key
 # job_names = []
@@ -325,14 +1725,459 @@ def start_call_analytics_job(job_name, input_media_uri, output_bucket):
 # json file at an s3 uri. download it
 
 def download_transcription(s3_uri):
-    s3 = boto3.client('s3', region_name='us-east-2')
-    bucket = s3_uri.split('/')[3]
-    key = '/'.join(s3_uri.split('/')[4:])
+    # the bucket's region is in the uri
+    region, bucket, key = split_s3_https_uri(s3_uri)
+    s3 = get_client('s3', region or 'us-east-2')
     response = s3.get_object(Bucket=bucket, Key=key)
     data = response['Body'].read()
     return json.loads(data)
 
 
+TRANSCRIPT_READ_SIZE = 64 * 1024
+# a whole string, a bracket, or a quote whose string isn't all read in yet
+_JSON_SKIP_TOKEN = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"|[\[\]{}]|"')
+_JSON_SCALAR_END = re.compile(r'[\s,\]}]')
+_JSON_WHITESPACE = re.compile(r'\s*')
+
+
+class _JsonStreamReader:
+    """
+    Just enough of a streaming json reader to walk down to one array in a big document and decode
+    its elements one at a time. Only the unread part of the current chunk is kept; values that
+    aren't wanted are skipped by scanning for brackets and strings, without decoding them.
+    """
+
+    def __init__(self, body, chunk_size=TRANSCRIPT_READ_SIZE):
+        self.body = body
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json_decoder = json.JSONDecoder()
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self):
+        # returns False once the body is used up
+        if self.eof:
+            return False
+        chunk = self.body.read(self.chunk_size)
+        self.eof = not chunk
+        self.buf = self.buf[self.pos:] + self.decoder.decode(chunk, final=self.eof)
+        self.pos = 0
+        return not self.eof
+
+    def peek(self):
+        while True:
+            self.pos = _JSON_WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill():
+                raise ValueError('unexpected end of json')
+
+    def expect(self, char):
+        if self.peek() != char:
+            raise ValueError(f'expected {char!r} in json at {self.buf[self.pos:self.pos + 20]!r}')
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.json_decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # the value runs past what's been read so far
+                if not self.fill():
+                    raise
+                continue
+            if end == len(self.buf) and not self.eof and not isinstance(value, (dict, list, str)):
+                # a number could carry on in the next chunk
+                self.fill()
+                continue
+            self.pos = end
+            return value
+
+    def skip(self):
+        if self.peek() not in '[{"':
+            while True:
+                m = _JSON_SCALAR_END.search(self.buf, self.pos)
+                if m:
+                    self.pos = m.start()
+                    return
+                self.pos = len(self.buf)
+                if not self.fill():
+                    return
+        depth = 0
+        while True:
+            for m in _JSON_SKIP_TOKEN.finditer(self.buf, self.pos):
+                token = m.group()
+                if token == '"':
+                    # a string that runs on into the next chunk
+                    self.pos = m.start()
+                    break
+                if token[0] != '"':
+                    depth += 1 if token in '[{' else -1
+                if depth == 0:
+                    self.pos = m.end()
+                    return
+            else:
+                self.pos = len(self.buf)
+            if not self.fill():
+                raise ValueError('unexpected end of json')
+
+    def keys(self):
+        """
+        Walks an object, yielding each key with the reader positioned at its value.
+        The caller has to read or skip the value before asking for the next key.
+        """
+        self.expect('{')
+        while True:
+            char = self.peek()
+            if char == '}':
+                self.pos += 1
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            key = self.value()
+            self.expect(':')
+            yield key
+
+    def elements(self):
+        self.expect('[')
+        while True:
+            char = self.peek()
+            if char == ']':
+                self.pos += 1
+                return
+            if char == ',':
+                self.pos += 1
+                continue
+            yield self.value()
+
+
+def iter_transcript_items(body, chunk_size=TRANSCRIPT_READ_SIZE):
+    """
+    Yields results.items of a transcribe output json one item at a time from a file-like body
+    (an s3 StreamingBody or an open file), without loading the whole document. The "items" lists
+    inside results.speaker_labels.segments are skipped over, not decoded.
+    """
+    reader = _JsonStreamReader(body, chunk_size)
+    for key in reader.keys():
+        if key != 'results' or reader.peek() != '{':
+            reader.skip()
+            continue
+        for results_key in reader.keys():
+            if results_key == 'items' and reader.peek() == '[':
+                yield from reader.elements()
+            else:
+                reader.skip()
+
+
+def stream_transcription_items(s3_uri, s3=None):
+    """
+    download_transcription's results.items, streamed from s3 rather than read in whole.
+    """
+    region, bucket, key = split_s3_https_uri(s3_uri)
+    if s3 is None:
+        s3 = get_client('s3', region or 'us-east-2')
+    body = s3.get_object(Bucket=bucket, Key=key)['Body']
+    try:
+        yield from iter_transcript_items(body)
+    finally:
+        body.close()
+
+
+
+class Transcript:
+    """
+    A transcript's words held in flat arrays rather than a dict per word:
+        tokens: int32 ids into vocab (each distinct word is stored once)
+        start, end: float32 seconds. punctuation has no times of its own and gets the end of the word before it
+        speaker: int8 index into speakers
+        confidence: float32
+    plus turn_starts, the index of the first word of every turn, worked out from where speaker changes.
+    Items without a speaker_label (punctuation sometimes) belong to the speaker before them.
+    """
+
+    def __init__(self, tokens, start, end, speaker, confidence, vocab, speakers):
+        self.tokens = tokens
+        self.start = start
+        self.end = end
+        self.speaker = speaker
+        self.confidence = confidence
+        self.vocab = vocab
+        self.speakers = speakers
+        if len(speaker):
+            self.turn_starts = np.concatenate(([0], np.flatnonzero(speaker[1:] != speaker[:-1]) + 1))
+        else:
+            self.turn_starts = np.zeros(0, dtype=np.int64)
+        self.turn_ends = np.append(self.turn_starts[1:], len(speaker))
+
+    @classmethod
+    def from_items(cls, items):
+        """
+        Builds a Transcript from results.items, which can be a stream (see stream_transcription_items).
+        """
+        ids = {}
+        speaker_ids = {}
+        tokens, start, end, speaker, confidence = array('i'), array('f'), array('f'), array('b'), array('f')
+        last_end = 0.0
+        current_speaker = None
+        for item in items:
+            alternative = item['alternatives'][0]
+            tokens.append(ids.setdefault(alternative['content'], len(ids)))
+            label = item.get('speaker_label', current_speaker)
+            if label is not None and label not in speaker_ids:
+                speaker_ids[label] = len(speaker_ids)
+            current_speaker = label
+            # -1 until the first labelled item, filled in below
+            speaker.append(speaker_ids[label] if label is not None else -1)
+            if 'start_time' in item:
+                start.append(float(item['start_time']))
+                last_end = float(item['end_time'])
+            else:
+                start.append(last_end)
+            end.append(last_end)
+            confidence.append(float(alternative.get('confidence') or 0))
+        speaker = np.frombuffer(speaker, dtype=np.int8).copy()
+        if len(speaker) and speaker[0] < 0:
+            # leading unlabelled items go with the first speaker
+            speaker[speaker < 0] = speaker[speaker >= 0][0] if (speaker >= 0).any() else 0
+            speaker_ids = speaker_ids or {None: 0}
+        vocab = np.empty(len(ids), dtype=object)
+        vocab[list(ids.values())] = list(ids.keys())
+        return cls(np.frombuffer(tokens, dtype=np.int32), np.frombuffer(start, dtype=np.float32),
+                   np.frombuffer(end, dtype=np.float32), speaker,
+                   np.frombuffer(confidence, dtype=np.float32), vocab, list(speaker_ids))
+
+    def __len__(self):
+        return len(self.tokens)
+
+    @property
+    def duration(self):
+        return float(self.end[-1]) if len(self) else 0.0
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.tokens, self.start, self.end, self.speaker, self.confidence))
+
+    def _subset(self, index):
+        return Transcript(self.tokens[index], self.start[index], self.end[index], self.speaker[index],
+                          self.confidence[index], self.vocab, self.speakers)
+
+    def turns(self, speaker=None, indices=None):
+        """
+        The same [{'speaker': ..., 'content': ...}] as construct_transcript_turns, optionally only
+        the turns of one speaker (e.g. 'spk_1') or only the turns at indices.
+        """
+        turn_speakers = self.speaker[self.turn_starts]
+        keep = np.arange(len(self.turn_starts)) if indices is None else np.asarray(indices, dtype=np.int64)
+        if speaker is not None:
+            if speaker not in self.speakers:
+                return []
+            keep = keep[turn_speakers[keep] == self.speakers.index(speaker)]
+        return [{'speaker': self.speakers[turn_speakers[i]],
+                 'content': ' '.join(self.vocab[self.tokens[self.turn_starts[i]:self.turn_ends[i]]])}
+                for i in keep]
+
+    def between(self, start_time, end_time):
+        """
+        The words spoken between start_time and end_time (seconds), as a Transcript sharing this one's arrays.
+        """
+        first = int(np.searchsorted(self.end, start_time, side='right'))
+        last = int(np.searchsorted(self.start, end_time, side='left'))
+        return self._subset(slice(first, max(first, last)))
+
+    def for_speaker(self, speaker):
+        """
+        Only the words of one speaker, as a Transcript.
+        """
+        if speaker not in self.speakers:
+            return self._subset(slice(0, 0))
+        return self._subset(self.speaker == self.speakers.index(speaker))
+
+
+TRANSCRIPT_ARRAYS = ('tokens', 'start', 'end', 'speaker', 'confidence')
+
+
+class TranscriptCache:
+    """
+    On-disk cache of Transcripts, keyed by the s3 uri and ETag of the transcription output, so a
+    transcript is downloaded and parsed once. Each one is a directory of .npy files (one per
+    Transcript array) that are memory-mapped back on a hit, plus meta.json with the vocab and speakers.
+    Once the cache holds more than max_bytes the least recently used transcripts are removed.
+    """
+
+    def __init__(self, root='transcript-cache', max_bytes=1024 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # running size of the cache in bytes, None until the first put sizes it
+        self._bytes = None
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'by-uri'), exist_ok=True)
+
+    @staticmethod
+    def make_key(s3_uri, etag):
+        etag = etag.strip('"')
+        return hashlib.sha256(f'{s3_uri}\n{etag}'.encode()).hexdigest()
+
+    def _uri_path(self, s3_uri):
+        return os.path.join(self.root, 'by-uri', hashlib.sha256(s3_uri.encode()).hexdigest())
+
+    def etag_for(self, s3_uri):
+        """
+        The ETag the transcript at s3_uri was last cached under, or None.
+        """
+        try:
+            with open(self._uri_path(s3_uri)) as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def get(self, s3_uri, etag):
+        entry = os.path.join(self.root, self.make_key(s3_uri, etag))
+        if not os.path.isdir(entry):
+            with self._lock:
+                self.misses += 1
+            return None
+        try:
+            with open(os.path.join(entry, 'meta.json')) as f:
+                meta = json.load(f)
+            arrays = [np.load(os.path.join(entry, f'{name}.npy'), mmap_mode='r') if meta['words'] else
+                      np.load(os.path.join(entry, f'{name}.npy')) for name in TRANSCRIPT_ARRAYS]
+            vocab = np.empty(len(meta['vocab']), dtype=object)
+            vocab[:] = meta['vocab']
+            transcript = Transcript(*arrays, vocab, meta['speakers'])
+            # the mtime is the last use, for eviction
+            os.utime(os.path.join(entry, 'meta.json'))
+        except (OSError, ValueError, KeyError, TypeError, EOFError) as e:
+            # truncated or corrupt (e.g. the disk filled up), or evicted while we read it: drop it and
+            # treat it as a miss so the transcript is downloaded again
+            print(f'dropping unreadable cached transcript {entry}: {e!r}')
+            size = self._entry_size(entry)
+            shutil.rmtree(entry, ignore_errors=True)
+            with self._lock:
+                self.misses += 1
+                if self._bytes is not None:
+                    self._bytes = max(0, self._bytes - size)
+            return None
+        with self._lock:
+            self.hits += 1
+        return transcript
+
+    def put(self, s3_uri, etag, transcript):
+        etag = etag.strip('"')
+        entry = os.path.join(self.root, self.make_key(s3_uri, etag))
+        added = 0
+        if not os.path.exists(entry):
+            # written to a temporary directory and renamed, so a reader never sees half of one
+            tmp = f'{entry}.tmp-{os.getpid()}-{threading.get_ident()}'
+            os.makedirs(tmp, exist_ok=True)
+            for name in TRANSCRIPT_ARRAYS:
+                np.save(os.path.join(tmp, f'{name}.npy'), np.ascontiguousarray(getattr(transcript, name)))
+            with open(os.path.join(tmp, 'meta.json'), 'w') as f:
+                json.dump({'uri': s3_uri, 'etag': etag, 'words': len(transcript),
+                           'vocab': list(transcript.vocab), 'speakers': transcript.speakers}, f)
+            size = self._entry_size(tmp)
+            try:
+                os.rename(tmp, entry)
+                added = size
+            except OSError:
+                # another worker cached the same transcript first
+                shutil.rmtree(tmp, ignore_errors=True)
+        with open(self._uri_path(s3_uri), 'w') as f:
+            f.write(etag)
+        with self._lock:
+            if self._bytes is None:
+                # sized once per process, then kept up to date as entries come and go
+                self._bytes = sum(size for _, size, _ in self._entries())
+            else:
+                self._bytes += added
+            # the directory is only walked once we're over the limit
+            if self._bytes > self.max_bytes:
+                self._evict()
+
+    @staticmethod
+    def _entry_size(path):
+        try:
+            return sum(f.stat().st_size for f in os.scandir(path))
+        except FileNotFoundError:
+            return 0
+
+    def _entries(self):
+        entries = []
+        for d in os.scandir(self.root):
+            if d.name == 'by-uri' or '.tmp-' in d.name or not d.is_dir():
+                continue
+            try:
+                files = list(os.scandir(d.path))
+                accessed = os.stat(os.path.join(d.path, 'meta.json')).st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append((accessed, sum(f.stat().st_size for f in files), d.path))
+        return entries
+
+    def _evict(self):
+        entries = self._entries()
+        # re-counted from disk, which also picks up anything other processes added
+        total = sum(size for _, size, _ in entries)
+        # least recently used first, down to a bit under the limit so the next few puts don't scan again
+        target = self.max_bytes * 0.9
+        for _, size, path in sorted(entries):
+            if total <= target:
+                break
+            shutil.rmtree(path, ignore_errors=True)
+            total -= size
+            self.evictions += 1
+        self._bytes = total
+
+    def stats(self):
+        entries = self._entries()
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': len(entries),
+                'bytes': sum(size for _, size, _ in entries)}
+
+
+_transcript_cache = None
+_transcript_cache_lock = threading.Lock()
+
+
+def get_transcript_cache():
+    # opened on first use, shared by everything in the process
+    global _transcript_cache
+    with _transcript_cache_lock:
+        if _transcript_cache is None:
+            _transcript_cache = TranscriptCache()
+        return _transcript_cache
+
+
+def get_transcript(s3_uri, use_cache=True, revalidate=False, s3=None):
+    """
+    The transcription output at s3_uri as a Transcript, from the TranscriptCache if it's there,
+    otherwise streamed in from s3 and cached.
+    By default whatever was cached for the uri last is trusted, so a cache hit doesn't touch the
+    network at all. Transcribe writes each job's output once under the job's name, so the cached
+    ETag only goes stale if an output is overwritten by hand; revalidate=True checks the ETag with
+    a HEAD request first for that case.
+    """
+    if not use_cache:
+        return Transcript.from_items(stream_transcription_items(s3_uri, s3))
+    cache = get_transcript_cache()
+    etag = None if revalidate else cache.etag_for(s3_uri)
+    if etag is None:
+        region, bucket, key = split_s3_https_uri(s3_uri)
+        if s3 is None:
+            s3 = get_client('s3', region or 'us-east-2')
+        etag = s3.head_object(Bucket=bucket, Key=key)['ETag'].strip('"')
+    transcript = cache.get(s3_uri, etag)
+    if transcript is None:
+        transcript = Transcript.from_items(stream_transcription_items(s3_uri, s3))
+        cache.put(s3_uri, etag, transcript)
+    return transcript
+
+
 ### analysis
 """
 prompts
@@ -479,17 +2324,85 @@ def analyze_post_call_analytics(s3_uri):
     }
 
 
+# chosen on the one sample call in the repo (normal-transcription.json against post-call-analytics.json
+# for the same recording): merging words less than 1200ms apart brings talk time to 775253ms against
+# call analytics' 775098ms. silence doesn't move with it, and comes out at 42352ms against 37391ms.
+# that's a single call, so check both against call analytics on a few of your own before relying on
+# them (local_call_analytics and process_transcription_outputs take them as parameters)
+TALK_MERGE_GAP_MS = 1200
+SILENCE_MIN_MS = 3000
+
+
+def talk_segments(start, end, merge_gap_ms=TALK_MERGE_GAP_MS):
+    """
+    Merges word intervals (ms, in start order) less than merge_gap_ms apart into stretches of talk.
+    Returns:
+        (array, array): the start and end of each stretch.
+    """
+    if not len(start):
+        return start, end
+    # how far the talk has reached by each word, so a long word overlapping the next ones isn't cut short
+    reach = np.maximum.accumulate(end)
+    first = np.flatnonzero(np.r_[True, start[1:] - reach[:-1] > merge_gap_ms])
+    return start[first], np.maximum.reduceat(end, first)
+
+
+def local_call_analytics(transcript, agent_speaker='spk_0', merge_gap_ms=TALK_MERGE_GAP_MS,
+                         silence_min_ms=SILENCE_MIN_MS):
+    """
+    The numbers analyze_post_call_analytics reads from a call analytics job, worked out instead from
+    a standard transcription's word timings (a Transcript, see get_transcript), in milliseconds:
+    talk time is the stretches of speech, silence the gaps between them of at least silence_min_ms,
+    talk_speed the agent's words per minute of their own talk time.
+    Diarized single channel transcripts (what start_transcription_job asks for) give every word to one
+    speaker and never overlap the speakers' words, so interruptions can't be told apart from quick
+    turn taking: num_interruptions is None rather than a 0 that looks real. Without call analytics
+    there's no sentiment or categories either, so overall_sentiment is NaN and categories an empty
+    list. The columns and types are the same as the call analytics path writes (see CALL_ANALYTICS_COLUMNS).
+    """
+    # punctuation has no duration of its own
+    words = transcript.end > transcript.start
+    start = np.round(transcript.start[words] * 1000.0)
+    end = np.round(transcript.end[words] * 1000.0)
+    speaker = transcript.speaker[words]
+
+    duration = int(end.max()) if len(end) else 0
+    segment_start, segment_end = talk_segments(start, end, merge_gap_ms)
+    talk_time = int((segment_end - segment_start).sum())
+    gaps = segment_start[1:] - segment_end[:-1]
+    silence_time = int(gaps[gaps >= silence_min_ms].sum())
+
+    talk_speed = 0
+    if agent_speaker in transcript.speakers:
+        agent = speaker == transcript.speakers.index(agent_speaker)
+        agent_start, agent_end = talk_segments(start[agent], end[agent], merge_gap_ms)
+        agent_talk_time = (agent_end - agent_start).sum()
+        if agent_talk_time:
+            talk_speed = int(round(agent.sum() / (agent_talk_time / 60000)))
+
+    return {
+        'duration': duration,
+        'talk_time': talk_time,
+        'silence_time': silence_time,
+        'talk_speed': talk_speed,
+        'num_interruptions': None,
+        'overall_sentiment': float('nan'),
+        'talk_time_percent': talk_time / duration if duration else 0.0,
+        'silence_time_percent': silence_time / duration if duration else 0.0,
+        'categories': [],
+    }
+
+
 def get_conversation(s3_uri):
     """
     find objections and classify
     find highlights and classify
     """
-    transcript_json = download_transcription(s3_uri)
-    # contains each work spoken
-    speech_data = transcript_json['results']['items']
+    # each word spoken, from the local transcript cache or streamed in from s3
+    transcript = get_transcript(s3_uri)
 
     # Construct transcript turns
-    conversation = construct_transcript_turns(speech_data)
+    conversation = transcript.turns()
     return conversation
 
 
@@ -524,20 +2437,277 @@ FUTURE: write a prompt that describes correct objection handling, and then compa
 """
 
 
-def invoke_model(prompt):
-    bedrock_runtime = boto3.client('bedrock-runtime', region_name='us-east-1')
+MODEL_ID = 'mistral.mistral-7b-instruct-v0:2'
+
+
+class LLMResponseCache:
+    """
+    On-disk (sqlite) cache of model responses, keyed by a hash of the model id and request body.
+    Entries older than ttl_seconds are treated as misses; once the cache holds more than
+    max_bytes of responses (or max_entries of them) the least recently used are evicted.
+    hits / misses / evictions count what happened since the cache was opened.
+    """
+
+    def __init__(self, path='llm-cache.db', max_bytes=512 * 1024 * 1024, ttl_seconds=30 * 24 * 3600,
+                 max_entries=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )""")
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_id, body):
+        return hashlib.sha256(json.dumps({'model_id': model_id, 'body': body}, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute('SELECT value, created_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+                self._conn.commit()
+                self.evictions += 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        value = json.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)',
+                               (key, value, len(value), now, now))
+            self._evict()
+            self._conn.commit()
+
+    def discard(self, key):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            self._conn.commit()
+
+    def _evict(self):
+        if self.ttl_seconds is not None:
+            cursor = self._conn.execute('DELETE FROM responses WHERE created_at < ?', (time.time() - self.ttl_seconds,))
+            self.evictions += cursor.rowcount
+        count, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        over_count = count - self.max_entries if self.max_entries is not None else 0
+        if total <= self.max_bytes and over_count <= 0:
+            return
+        # walk from least recently used until both limits are met
+        doomed = []
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+            if total <= self.max_bytes and over_count <= 0:
+                break
+            doomed.append((key,))
+            total -= size
+            over_count -= 1
+        self._conn.executemany('DELETE FROM responses WHERE key = ?', doomed)
+        self.evictions += len(doomed)
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'entries': count,
+                'bytes': total}
+
+
+_llm_cache = None
+_llm_cache_lock = threading.Lock()
+
+
+def get_llm_cache():
+    # opened on first use, shared by everything in the process
+    global _llm_cache
+    with _llm_cache_lock:
+        if _llm_cache is None:
+            _llm_cache = LLMResponseCache()
+        return _llm_cache
+
+
+MAX_OUTPUT_TOKENS = 1000
+
+
+def _model_request_body(prompt, max_tokens=MAX_OUTPUT_TOKENS):
     enclosed_prompt = "<s>[INST]" + prompt + "[/INST]"
-    body = {
+    return {
         "prompt": enclosed_prompt,
-        "max_tokens": 1000,
+        "max_tokens": max_tokens,
     }
-    response = bedrock_runtime.invoke_model(
-        body=json.dumps(body),
-        contentType='application/json',
-        accept='application/json',
-        modelId='mistral.mistral-7b-instruct-v0:2'
-    )
-    response_body = json.loads(response["body"].read())
+
+
+def estimate_tokens(text):
+    # close enough for english text and rate limiting; ~4 characters per token
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Refills at rate tokens per second up to capacity. acquire() blocks until enough are available.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        # a request bigger than the bucket would never fit, let it through when the bucket is full
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+THROTTLING_ERROR_CODES = ('ThrottlingException', 'TooManyRequestsException', 'ServiceUnavailableException')
+
+
+class BedrockRateLimiter:
+    """
+    Gate for concurrent model calls, shared by all the scoring threads.
+    Each call waits for a concurrency slot, one request from the requests/s bucket and its
+    estimated tokens from the tokens/min bucket. The concurrency limit is AIMD: it grows by
+    1/limit on every successful call and halves on every ThrottlingException, and throttled
+    calls are retried with jittered exponential backoff. So are 5xxs and dropped connections
+    (is_transient_error), without touching the limit: botocore doesn't retry bedrock-runtime (AWS_RETRIES).
+    """
+
+    def __init__(self, requests_per_second=5, tokens_per_minute=200000, max_concurrency=16, min_concurrency=1,
+                 max_retries=6, backoff=1.0):
+        self.request_bucket = TokenBucket(requests_per_second, max(1, requests_per_second))
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.limit = float(max_concurrency)
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.in_flight = 0
+        self.calls = 0
+        self.throttles = 0
+        self._cond = threading.Condition()
+
+    def _acquire_slot(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def _release_slot(self, outcome):
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == 'throttled':
+                self.throttles += 1
+                self.limit = max(self.min_concurrency, self.limit / 2)
+            elif outcome == 'ok':
+                self.limit = min(self.max_concurrency, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+    def call(self, fn, tokens=1):
+        attempt = 0
+        while True:
+            self._acquire_slot()
+            self.request_bucket.acquire(1)
+            self.token_bucket.acquire(tokens)
+            with self._cond:
+                self.calls += 1
+            try:
+                result = fn()
+            except Exception as e:
+                throttled = is_client_error(e, *THROTTLING_ERROR_CODES)
+                if not throttled and not is_transient_error(e):
+                    self._release_slot('error')
+                    raise
+                self._release_slot('throttled' if throttled else 'error')
+                attempt += 1
+                if attempt > self.max_retries:
+                    raise
+                time.sleep(self.backoff * (2 ** (attempt - 1)) * (1 + random.random()))
+                continue
+            self._release_slot('ok')
+            return result
+
+
+def run_ordered(fn, items, max_workers=16):
+    """
+    Calls fn(item) for every item on a thread pool.
+    Returns:
+        list: {'result': ..., 'error': ...} per item, in the same order as items. An exception
+        raised by fn ends up as that item's 'error' instead of stopping the others.
+    """
+    results = [None] * len(items)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(fn, item): i for i, item in enumerate(items)}
+        for future in as_completed(futures):
+            i = futures[future]
+            try:
+                results[i] = {'result': future.result(), 'error': None}
+            except Exception as e:
+                results[i] = {'result': None, 'error': e}
+    return results
+
+
+def llm_cache_key(prompt, max_tokens=MAX_OUTPUT_TOKENS):
+    return LLMResponseCache.make_key(MODEL_ID, _model_request_body(prompt, max_tokens))
+
+
+def invoke_model(prompt, use_cache=True, limiter=None, max_tokens=MAX_OUTPUT_TOKENS):
+    """
+    Sends the prompt to mistral on bedrock. Responses are cached on disk (see LLMResponseCache),
+    so a byte-identical prompt is only paid for once; use_cache=False skips the cache entirely.
+    Calls that miss the cache go through limiter (a BedrockRateLimiter) if one is given.
+    """
+    body = _model_request_body(prompt, max_tokens)
+    if use_cache:
+        key = LLMResponseCache.make_key(MODEL_ID, body)
+        cached = get_llm_cache().get(key)
+        if cached is not None:
+            return cached
+    bedrock_runtime = get_client('bedrock-runtime', 'us-east-1')
+
+    def call():
+        response = bedrock_runtime.invoke_model(
+            body=json.dumps(body),
+            contentType='application/json',
+            accept='application/json',
+            modelId=MODEL_ID
+        )
+        return json.loads(response["body"].read())
+
+    if limiter is None:
+        response_body = call()
+    else:
+        response_body = limiter.call(call, tokens=estimate_tokens(body['prompt']) + max_tokens)
+    if use_cache:
+        get_llm_cache().put(key, response_body)
     return response_body
     # resp=invoke_model(prompt)
     # json.loads(resp['outputs'][0]['text'].strip())
@@ -595,13 +2765,217 @@ JSON:
 """
     return prompt
 
+# a relevance index over the objection library, so each prompt only carries the entries that
+# look related to what the customer actually said
+LIBRARY_STOPWORDS = {
+    'a', 'an', 'the', 'and', 'or', 'but', 'if', 'of', 'to', 'in', 'on', 'for', 'with', 'at', 'by', 'from',
+    'is', 'are', 'was', 'were', 'be', 'been', 'am', 'it', "it's", 'this', 'that', 'i', "i'm", 'me', 'my',
+    'you', 'your', 'we', 'our', 'they', 'them', 'so', 'just', 'um', 'uh', 'yeah', 'okay', 'oh', 'like',
+}
+
+
+def library_terms(text):
+    # unigrams and bigrams of the non-stopwords
+    words = [w for w in re.findall(r"[a-z0-9']+", text.lower().replace('_', ' ')) if w not in LIBRARY_STOPWORDS]
+    return words + [f'{a} {b}' for a, b in zip(words, words[1:])]
+
+
+class ObjectionLibraryIndex:
+    """
+    TF-IDF index over the objection library (id words + example objection + example response).
+    select() scores every entry against the customer's (spk_1) turns and returns the top k,
+    in library order so the same selection gives a byte-identical prompt (and a cache hit).
+    calls / tokens_saved count the selections and the prompt tokens they saved; it's shared by the
+    scoring threads, so read them with stats().
+    """
+
+    def __init__(self, library, customer_speaker='spk_1'):
+        self.library = library
+        self.customer_speaker = customer_speaker
+        docs = [library_terms(' '.join([entry.get('id', ''), entry.get('example_objection', ''),
+                                         entry.get('example_response', '')]))
+                for entry in library]
+        df = {}
+        for terms in docs:
+            for term in set(terms):
+                df[term] = df.get(term, 0) + 1
+        self.idf = {term: math.log((len(docs) + 1) / (n + 1)) + 1 for term, n in df.items()}
+        self.vectors = [self._vector(terms) for terms in docs]
+        self.full_library_tokens = estimate_tokens(json.dumps(json.dumps(prompt_library_entries(library))))
+        self.calls = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+
+    def _vector(self, terms):
+        counts = {}
+        for term in terms:
+            if term in self.idf:
+                counts[term] = counts.get(term, 0) + 1
+        vector = {term: (1 + math.log(n)) * self.idf[term] for term, n in counts.items()}
+        norm = math.sqrt(sum(w * w for w in vector.values())) or 1.0
+        return {term: w / norm for term, w in vector.items()}
+
+    def select(self, turns, k=8):
+        """
+        Returns:
+            list: the k library entries most relevant to the customer's turns.
+        """
+        customer_text = ' '.join(t['content'] for t in turns if t.get('speaker') == self.customer_speaker)
+        query = self._vector(library_terms(customer_text))
+        scores = [sum(w * query.get(term, 0.0) for term, w in vector.items()) for vector in self.vectors]
+        top = sorted(range(len(scores)), key=lambda i: -scores[i])[:k]
+        selected = [self.library[i] for i in sorted(top)]
+        saved = self.full_library_tokens - estimate_tokens(compact_library(selected))
+        with self._lock:
+            self.calls += 1
+            self.tokens_saved += saved
+        return selected
+
+    def stats(self):
+        with self._lock:
+            return {'calls': self.calls, 'tokens_saved': self.tokens_saved}
+
+
+def compact_library(library):
+    # already-encoded libraries (a json string) are passed through rather than encoded twice
+    if isinstance(library, str):
+        return library
+    return json.dumps(prompt_library_entries(library), separators=(',', ':'))
+
+
+def prompt_library_entries(library):
+    # keywords are only for the pre-screen, the model doesn't need them
+    return [{k: v for k, v in entry.items() if k != 'keywords'} for entry in library]
+
+
+def normalize_word(word):
+    # lower case letters, digits and apostrophes only; punctuation items come out empty
+    return re.sub(r"[^a-z0-9']", '', word.lower().replace('\u2019', "'"))
+
+
+class PhraseMatcher:
+    """
+    Aho-Corasick automaton over words rather than characters, so phrases only match on word
+    boundaries. Finds every occurrence of every phrase in one pass over the words, however many
+    phrases there are.
+    """
+
+    def __init__(self):
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+
+    def add(self, phrase, value):
+        words = [w for w in (normalize_word(w) for w in phrase.split()) if w]
+        if not words:
+            return
+        node = 0
+        for word in words:
+            if word not in self.goto[node]:
+                self.goto[node][word] = len(self.goto)
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = self.goto[node][word]
+        self.out[node].append((len(words), value))
+
+    def build(self):
+        # breadth first, so every node's failure link is already set when its children need it
+        pending = queue.deque(self.goto[0].values())
+        while pending:
+            node = pending.popleft()
+            for word, child in self.goto[node].items():
+                pending.append(child)
+                fail = self.fail[node]
+                while fail and word not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(word, 0) if node else 0
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+        return self
+
+    def finditer(self, words):
+        """
+        Yields (first word index, last word index + 1, value) for every match in words
+        (already normalized). An empty string never matches, so it can separate runs of words.
+        """
+        node = 0
+        for i, word in enumerate(words):
+            while node and word not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(word, 0)
+            for length, value in self.out[node]:
+                yield i - length + 1, i + 1, value
+
+
+class ObjectionPrescreen:
+    """
+    Finds the customer's likely objections without a model call: a PhraseMatcher built once from each
+    library entry's example_objection and its keywords, run over the customer's words.
+    Calls with no candidates don't need scoring; for the rest, excerpt() keeps only the turns
+    around the candidates. calls / skipped count what it has seen.
+    """
+
+    def __init__(self, library, customer_speaker='spk_1', context_turns=2):
+        self.customer_speaker = customer_speaker
+        self.context_turns = context_turns
+        self.matcher = PhraseMatcher()
+        for entry in library:
+            for phrase in [entry.get('example_objection', '')] + entry.get('keywords', []):
+                self.matcher.add(phrase, (entry['id'], phrase))
+        self.matcher.build()
+        self.calls = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def candidates(self, transcript):
+        """
+        Returns:
+            list: {'id', 'phrase', 'start_time', 'end_time', 'turn'} for every match in the
+            customer's turns, turn being the index into transcript.turns().
+        """
+        found = []
+        if self.customer_speaker in transcript.speakers:
+            words = np.array([normalize_word(w) for w in transcript.vocab], dtype=object)[transcript.tokens]
+            customer = transcript.speaker == transcript.speakers.index(self.customer_speaker)
+            # punctuation dropped, and a '' between turns so a phrase can't run from one turn into the next
+            keep = np.flatnonzero(customer & (words != ''))
+            turn_of = np.searchsorted(transcript.turn_starts, keep, side='right') - 1
+            sequence = []
+            positions = []
+            for i, (position, turn) in enumerate(zip(keep, turn_of)):
+                if i and turn != turn_of[i - 1]:
+                    sequence.append('')
+                    positions.append(-1)
+                sequence.append(words[position])
+                positions.append(position)
+            for first, last, (objection_id, phrase) in self.matcher.finditer(sequence):
+                first, last = positions[first], positions[last - 1]
+                found.append({'id': objection_id, 'phrase': phrase,
+                              'start_time': float(transcript.start[first]), 'end_time': float(transcript.end[last]),
+                              'turn': int(np.searchsorted(transcript.turn_starts, first, side='right') - 1)})
+        with self._lock:
+            self.calls += 1
+            self.skipped += not found
+        return found
+
+    def excerpt(self, transcript, candidates):
+        """
+        The turns within context_turns of any candidate, in order, as construct_transcript_turns would give them.
+        """
+        keep = set()
+        for candidate in candidates:
+            keep.update(range(max(candidate['turn'] - self.context_turns, 0),
+                              min(candidate['turn'] + self.context_turns + 1, len(transcript.turn_starts))))
+        return transcript.turns(indices=sorted(keep))
+
+
 def create_objection_scoring_prompt(library, transcript, scoring_example):
     prompt = f"""
 {transcript}
 
 ---
 objection library:
-{json.dumps(library)}
+{compact_library(library)}
 ---
 
 above is a phone conversation transcript, followed by an objection library. The agent who received
@@ -620,13 +2994,13 @@ JSON:
     return prompt
 
 
-def load_responses(conversations):
+def load_responses(conversations, use_cache=True, limiter=None):
     responses = []
     dead_responses=[]
     for conversation in conversations:
         prompt = create_prompt(conversation)
         print(prompt[:200])
-        response = invoke_model(prompt)
+        response = invoke_model(prompt, use_cache=use_cache, limiter=limiter)
         try:
             print('model response', response)
             ary = json.loads(response['outputs'][0]['text'].strip())
@@ -634,22 +3008,619 @@ def load_responses(conversations):
                 responses.append(obj)
         except:
             dead_responses.append(response)
+            # don't keep serving an unusable answer from the cache
+            if use_cache:
+                get_llm_cache().discard(llm_cache_key(prompt))
     return responses, dead_responses
 
-def generate_score_responses(conversation, library, scoring_example):
-    responses = []
-    dead_responses=[]
-    p = create_objection_scoring_prompt(library, conversation, scoring_example)
-    print(p[:200])
-    response = invoke_model(p)
+def parse_score_response(response):
+    """
+    Turns a model response into the (responses, dead_responses) pair generate_score_responses returns.
+    """
     try:
         ary = json.loads(response['outputs'][0]['text'].strip())
-        responses.append(ary)
+        return [ary], []
     except:
-        dead_responses.append(response)
+        return [], [response]
+
+
+# long calls are scored in overlapping windows of turns so the prompt (and the latency) stays
+# the same size however long the call is, and the answer isn't cut off at max_tokens
+SCORING_WINDOW_TOKENS = 6000
+SCORING_WINDOW_OVERLAP_TURNS = 2
+
+
+def split_turns_into_windows(turns, max_tokens, overlap_turns=SCORING_WINDOW_OVERLAP_TURNS):
+    """
+    Splits construct_transcript_turns output into windows of at most max_tokens (estimated),
+    each starting with the last overlap_turns turns of the window before it, so an objection and
+    the agent's answer that straddle a boundary are both seen together at least once.
+    A single turn longer than max_tokens is split on word boundaries.
+    """
+    pieces = []
+    for turn in turns:
+        if estimate_tokens(str(turn)) <= max_tokens:
+            pieces.append(turn)
+            continue
+        words = turn['content'].split(' ')
+        chunk = []
+        for word in words:
+            if chunk and estimate_tokens(' '.join(chunk + [word])) + 20 > max_tokens:
+                pieces.append({'speaker': turn['speaker'], 'content': ' '.join(chunk)})
+                chunk = []
+            chunk.append(word)
+        if chunk:
+            pieces.append({'speaker': turn['speaker'], 'content': ' '.join(chunk)})
+
+    windows = []
+    current = []
+    size = 0
+    for turn in pieces:
+        # the prompt renders the list with ', ' between turns
+        turn_size = estimate_tokens(str(turn)) + 1
+        if current and size + turn_size > max_tokens:
+            windows.append(current)
+            current = current[-overlap_turns:] if overlap_turns else []
+            size = sum(estimate_tokens(str(t)) + 1 for t in current)
+            while current and size + turn_size > max_tokens:
+                size -= estimate_tokens(str(current[0])) + 1
+                current = current[1:]
+        current.append(turn)
+        size += turn_size
+    if current:
+        windows.append(current)
+    return windows
+
+
+def build_scoring_prompts(conversation, library, scoring_example, max_prompt_tokens=None):
+    """
+    The scoring prompt for a conversation, or one per window if it would be longer than max_prompt_tokens.
+    """
+    prompt = create_objection_scoring_prompt(library, conversation, scoring_example)
+    if max_prompt_tokens is None or estimate_tokens(prompt) <= max_prompt_tokens:
+        return [prompt]
+    scaffold_tokens = estimate_tokens(create_objection_scoring_prompt(library, [], scoring_example))
+    windows = split_turns_into_windows(conversation, max(max_prompt_tokens - scaffold_tokens, 200))
+    return [create_objection_scoring_prompt(library, window, scoring_example) for window in windows]
+
+
+def merge_score_responses(results):
+    """
+    Merges the (responses, dead_responses) of several windows of the same call, in window order, into one.
+    An objection in the turns two neighbouring windows share is reported by both, so an objection
+    from the window before with the same library id and the same actual_objection (ignoring case and
+    punctuation) is kept once, in the version with the fullest agent response. The same kind of
+    objection raised again elsewhere in the call is a separate objection and is kept.
+    """
+    merged = []
+    dead_responses = []
+    previous = {}  # (id, text) -> index in merged, for the window before
+    for responses, dead in results:
+        dead_responses += dead
+        current = {}
+        for ary in responses:
+            for obj in (ary if isinstance(ary, list) else [ary]):
+                if not isinstance(obj, dict):
+                    continue
+                text = ' '.join(normalize_word(word) for word in str(obj.get('actual_objection') or '').split())
+                key = (obj.get('id'), text.strip())
+                # each one in the window before can only be matched once
+                i = previous.pop(key, None)
+                if i is None:
+                    current[key] = len(merged)
+                    merged.append(obj)
+                    continue
+                # the overlap
+                current[key] = i
+                if len(str(obj.get('agent_response', ''))) > len(str(merged[i].get('agent_response', ''))):
+                    merged[i] = obj
+        previous = current
+    responses = [merged] if merged else []
     return responses, dead_responses
+
+
+def generate_score_responses(conversation, library, scoring_example, use_cache=True, limiter=None,
+                             max_prompt_tokens=None, max_workers=4):
+    """
+    Scores the objections in one conversation. With max_prompt_tokens set, a conversation too long
+    for that is scored in overlapping windows, in parallel, and the objections merged.
+    """
+    prompts = build_scoring_prompts(conversation, library, scoring_example, max_prompt_tokens)
+
+    def score(p):
+        print(p[:200])
+        response = invoke_model(p, use_cache=use_cache, limiter=limiter)
+        responses, dead_responses = parse_score_response(response)
+        # don't keep serving an unusable answer from the cache
+        if dead_responses and use_cache:
+            get_llm_cache().discard(llm_cache_key(p))
+        return responses, dead_responses
+
+    if len(prompts) == 1:
+        return score(prompts[0])
+    results = run_ordered(score, prompts, max_workers=max_workers)
+    for result in results:
+        if result['error'] is not None:
+            raise result['error']
+    return merge_score_responses([result['result'] for result in results])
+
+
+# short calls are packed several to a request, so the prompt scaffolding and the library are
+# sent once per pack instead of once per call. each call in a pack gets its own share of output tokens.
+SHORT_CALL_TOKENS = 1500
+PACKED_SCORING_TOKENS = 4000
+MAX_CALLS_PER_PACK = 4
+
+
+def pack_conversations(conversations, token_budget=PACKED_SCORING_TOKENS, max_calls=MAX_CALLS_PER_PACK):
+    """
+    Bin-packs conversations (tracking_guid -> turns) first fit decreasing, so each pack's
+    transcripts add up to no more than token_budget (estimated) and no more than max_calls calls.
+    A conversation bigger than the budget gets a pack to itself.
+    Returns:
+        list: lists of tracking_guids, one per scoring request, sorted so the same calls always
+        make the same prompt.
+    """
+    sizes = {guid: estimate_tokens(str(turns)) for guid, turns in conversations.items()}
+    packs = []
+    for guid in sorted(sizes, key=lambda g: (-sizes[g], g)):
+        for pack in packs:
+            if len(pack['guids']) < max_calls and pack['size'] + sizes[guid] <= token_budget:
+                pack['guids'].append(guid)
+                pack['size'] += sizes[guid]
+                break
+        else:
+            packs.append({'guids': [guid], 'size': sizes[guid]})
+    return [sorted(pack['guids']) for pack in packs]
+
+
+def create_packed_scoring_prompt(library, conversations, scoring_example):
+    """
+    Like create_objection_scoring_prompt, for several calls at once. conversations is
+    tracking_guid -> turns; the model is asked for a json object keyed by tracking_guid.
+    """
+    transcripts = '\n\n'.join(f"call {guid}:\n{turns}" for guid, turns in conversations.items())
+    packed_example = {'<tracking_guid>': scoring_example}
+    prompt = f"""
+{transcripts}
+
+---
+objection library:
+{compact_library(library)}
+---
+
+above are {len(conversations)} separate phone conversation transcripts, each headed by its call id, followed by
+an objection library. In every call the agent who received the call is "spk_0". The customer is "spk_1".
+The company taking the calls offers structured debt services for people with debts they cannot pay off,
+such as credit card debt or medical bills. These are sales calls where the agent seeks to get the
+customer to commit to the service.
+For each call separately, find all the objections the customer discusses, such as concerns about whether
+the offer is legitimate, and whether the credit check will hurt them. Compare them to the list of
+accepted objections and responses in the library. For each objection, state how the agent handles responds.
+then, give the agent a score based on how well they handled the objection. If the agent's response is
+close to the accepted response, give them a score of 10. If the agent's response is the opposite of
+the accepted response, give a 0. You can give numbers in between too. Return one JSON object with every
+call id as a key ({', '.join(conversations)}) and an array of objects for that call as the value
+(an empty array if the customer raised no objections), like this:
+{json.dumps(packed_example)}
+JSON:
+"""
+    return prompt
+
+
+def parse_packed_score_response(response, tracking_guids):
+    """
+    Splits a packed model response back into tracking_guid -> (responses, dead_responses), the same
+    shape generate_score_responses returns per call. Only the calls the model answered under their own
+    key (with an array) are returned, so the caller can score the rest one at a time; None if the
+    answer isn't a json object at all.
+    """
+    try:
+        by_guid = json.loads(response['outputs'][0]['text'].strip())
+    except:
+        return None
+    if not isinstance(by_guid, dict):
+        return None
+    # a call that's missing or mis-keyed hasn't been scored, it doesn't have no objections
+    return {guid: ([by_guid[guid]], []) for guid in tracking_guids if isinstance(by_guid.get(guid), list)}
+
+
+def generate_packed_score_responses(conversations, select_library, scoring_example, use_cache=True,
+                                    limiter=None, token_budget=PACKED_SCORING_TOKENS,
+                                    max_calls=MAX_CALLS_PER_PACK, max_workers=16):
+    """
+    Scores many short conversations (tracking_guid -> turns) a few per request.
+    select_library is called with the concatenated turns of a pack and returns the library to send.
+    Calls missing from a pack's answer (or the whole pack, if it can't be split back up) are scored
+    again call by call.
+    Returns:
+        dict: tracking_guid -> {'result': (responses, dead_responses), 'error': ...}, like run_ordered.
+    """
+    packs = pack_conversations(conversations, token_budget, max_calls)
+
+    def score_pack(guids):
+        library = select_library([turn for guid in guids for turn in conversations[guid]])
+        if len(guids) == 1:
+            return {guids[0]: generate_score_responses(conversations[guids[0]], library, scoring_example,
+                                                       use_cache=use_cache, limiter=limiter)}
+        prompt = create_packed_scoring_prompt(library, {guid: conversations[guid] for guid in guids},
+                                              scoring_example)
+        max_tokens = MAX_OUTPUT_TOKENS * len(guids)
+        print(prompt[:200])
+        response = invoke_model(prompt, use_cache=use_cache, limiter=limiter, max_tokens=max_tokens)
+        split = parse_packed_score_response(response, guids) or {}
+        missing = [guid for guid in guids if guid not in split]
+        if not missing:
+            return split
+        print('Could not split packed response, scoring calls one at a time', missing)
+        if use_cache:
+            get_llm_cache().discard(llm_cache_key(prompt, max_tokens))
+        for guid in missing:
+            split[guid] = generate_score_responses(conversations[guid], library, scoring_example,
+                                                   use_cache=use_cache, limiter=limiter)
+        return split
+
+    results = {}
+    for guids, packed in zip(packs, run_ordered(score_pack, packs, max_workers=max_workers)):
+        for guid in guids:
+            if packed['error'] is not None:
+                results[guid] = {'result': None, 'error': packed['error']}
+            else:
+                results[guid] = {'result': packed['result'][guid], 'error': None}
+    print(f"packed {len(conversations)} short calls into {len(packs)} scoring requests")
+    return results
+
+
+# bedrock batch inference, for big backfills where nobody is waiting on the answers
+BATCH_JOB_DONE_STATUSES = ('Completed', 'PartiallyCompleted')
+BATCH_JOB_FAILED_STATUSES = ('Failed', 'Stopped', 'Expired')
+
+
+def start_batch_scoring_job(prompts, bucket, batch_id, role_arn, bedrock=None, s3=None, records_per_file=10000):
+    """
+    Writes the prompts as bedrock batch inference JSONL files under
+    s3://bucket/batch-inference/batchid_<batch_id>/<run>/input/ and submits a model invocation job over them.
+    Args:
+        prompts (dict): tracking_guid -> prompt, the guid is used as the recordId
+        role_arn (str): role bedrock assumes to read the input and write the output
+    Returns:
+        (str, str): the job arn and the s3 prefix the outputs will be written under
+    """
+    if bedrock is None:
+        bedrock = get_client('bedrock', 'us-east-1')
+    if s3 is None:
+        s3 = get_client('s3', 'us-east-1')
+    run_id = time.strftime('%Y%m%d%H%M%S')
+    prefix = f"batch-inference/batchid_{batch_id}/{run_id}"
+    records = [json.dumps({'recordId': str(guid), 'modelInput': _model_request_body(prompt)})
+               for guid, prompt in prompts.items()]
+    for part, start in enumerate(range(0, len(records), records_per_file)):
+        body = '\n'.join(records[start:start + records_per_file]) + '\n'
+        s3.put_object(Bucket=bucket, Key=f"{prefix}/input/part-{part:05d}.jsonl", Body=body.encode())
+    # job names allow letters, numbers, dashes, dots and pluses
+    job_name = re.sub(r'[^a-zA-Z0-9\-.+]', '-', f"objection-scoring-{batch_id}-{run_id}")[:63]
+    response = bedrock.create_model_invocation_job(
+        jobName=job_name,
+        roleArn=role_arn,
+        modelId=MODEL_ID,
+        inputDataConfig={'s3InputDataConfig': {'s3Uri': f"s3://{bucket}/{prefix}/input/", 's3InputFormat': 'JSONL'}},
+        outputDataConfig={'s3OutputDataConfig': {'s3Uri': f"s3://{bucket}/{prefix}/output/"}},
+    )
+    print(f"Submitted batch inference job {response['jobArn']} with {len(records)} prompts")
+    return response['jobArn'], f"{prefix}/output/"
+
+
+def wait_for_batch_scoring_job(job_arn, bedrock, poll_interval=60, sleep=time.sleep):
+    # batch jobs take minutes to hours, there's no point polling often
+    while True:
+        job = bedrock.get_model_invocation_job(jobIdentifier=job_arn)
+        if job['status'] in BATCH_JOB_DONE_STATUSES:
+            return job
+        if job['status'] in BATCH_JOB_FAILED_STATUSES:
+            raise RuntimeError(f"batch inference job {job_arn} {job['status']}: {job.get('message')}")
+        print(f"Batch inference job is {job['status']}")
+        sleep(poll_interval)
+
+
+def read_batch_scoring_outputs(bucket, output_prefix, s3):
+    """
+    Reads every *.jsonl.out file bedrock wrote under output_prefix.
+    Returns:
+        dict: recordId -> modelOutput (records that errored have no modelOutput and are left out)
+    """
+    outputs = {}
+    for page in s3.get_paginator('list_objects_v2').paginate(Bucket=bucket, Prefix=output_prefix):
+        for obj in page.get('Contents', []):
+            if not obj['Key'].endswith('.jsonl.out'):
+                continue
+            body = s3.get_object(Bucket=bucket, Key=obj['Key'])['Body']
+            for line in body.iter_lines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if 'modelOutput' in record:
+                    outputs[record['recordId']] = record['modelOutput']
+    return outputs
+
+
+def run_batch_scoring(prompts, bucket, batch_id, role_arn, bedrock=None, s3=None, poll_interval=60,
+                      sleep=time.sleep):
+    """
+    Scores all the prompts with one bedrock batch inference job instead of one invoke_model each.
+    Returns:
+        dict: tracking_guid -> (responses, dead_responses), as generate_score_responses would give.
+        Prompts that got no output from the job are missing.
+    """
+    if bedrock is None:
+        bedrock = get_client('bedrock', 'us-east-1')
+    if s3 is None:
+        s3 = get_client('s3', 'us-east-1')
+    job_arn, output_prefix = start_batch_scoring_job(prompts, bucket, batch_id, role_arn, bedrock, s3)
+    wait_for_batch_scoring_job(job_arn, bedrock, poll_interval, sleep)
+    outputs = read_batch_scoring_outputs(bucket, output_prefix, s3)
+    return {guid: parse_score_response(outputs[str(guid)]) for guid in prompts if str(guid) in outputs}
     #scores, broken_scores=load_score_responses(conversations)
 
+RESULTS_PREFIX = 'results'
+# fixed types, so every part file has the same schema whatever the model left out
+OBJECTION_SCORE_COLUMNS = {
+    'tracking_guid': pa.string(),
+    'agent': pa.string(),
+    'objection_id': pa.string(),
+    'example_objection': pa.string(),
+    'actual_objection': pa.string(),
+    'example_response': pa.string(),
+    'agent_response': pa.string(),
+    'score': pa.float64(),
+    'unparseable': pa.int64(),
+}
+# what analyze_post_call_analytics and local_call_analytics return, plus the call
+CALL_ANALYTICS_COLUMNS = {
+    'tracking_guid': pa.string(),
+    'duration': pa.float64(),
+    'talk_time': pa.float64(),
+    'silence_time': pa.float64(),
+    'talk_speed': pa.float64(),
+    'num_interruptions': pa.float64(),
+    'overall_sentiment': pa.float64(),
+    'talk_time_percent': pa.float64(),
+    'silence_time_percent': pa.float64(),
+    'categories': pa.list_(pa.string()),
+}
+# every part file of a table gets the same schema whatever rows happen to be in it, so a
+# partition reads back with pd.read_parquet
+RESULT_SCHEMAS = {
+    'objection-scores': pa.schema(list(OBJECTION_SCORE_COLUMNS.items())),
+    'call-analytics': pa.schema(list(CALL_ANALYTICS_COLUMNS.items())),
+}
+
+
+def result_dtypes(table):
+    # the pandas dtypes for a RESULT_SCHEMAS table, with pandas' string dtype for strings
+    return {field.name: 'string' if pa.types.is_string(field.type) else field.type.to_pandas_dtype()
+            for field in RESULT_SCHEMAS[table]}
+# calls with no date in the call log
+NO_DATE_PARTITION = 'unknown'
+
+
+def score_rows(tracking_guid, responses, dead_responses=(), agent=None):
+    """
+    Flattens a call's (responses, dead_responses) into one row per objection, or a single row with
+    no objection if the model found none, so every scored call shows up in the results.
+    agent is the call log's agent for the call, if known.
+    """
+    rows = []
+    for ary in responses:
+        for obj in (ary if isinstance(ary, list) else [ary]):
+            if not isinstance(obj, dict):
+                continue
+            rows.append({
+                'tracking_guid': tracking_guid,
+                'agent': agent,
+                'objection_id': obj.get('id'),
+                'example_objection': obj.get('example_objection'),
+                'actual_objection': obj.get('actual_objection'),
+                'example_response': obj.get('example_response'),
+                'agent_response': obj.get('agent_response'),
+                'score': obj.get('score'),
+                'unparseable': len(dead_responses),
+            })
+    if not rows:
+        rows.append({**dict.fromkeys(OBJECTION_SCORE_COLUMNS), 'tracking_guid': tracking_guid, 'agent': agent,
+                     'unparseable': len(dead_responses)})
+    return rows
+
+
+class ResultSink:
+    """
+    Buffers per-call results as rows and writes them to s3 as parquet, partitioned by batch and call date:
+        <prefix>/objection-scores/batch_id=<batch_id>/date=<YYYY-MM-DD>/part-<uuid>.parquet
+        <prefix>/call-analytics/batch_id=<batch_id>/date=<YYYY-MM-DD>/part-<uuid>.parquet
+    A file per table and date is written once flush_calls calls or flush_rows rows have built up,
+    or flush_interval seconds after the last write, and on flush()/close(), so a run that dies only
+    loses what it added since then.
+    on_flush(table, key, tracking_guids) is called after each file is written, e.g. to mark those calls written.
+    Thread safe, so pipeline workers can share one.
+    """
+
+    def __init__(self, bucket, batch_id, s3=None, prefix=RESULTS_PREFIX, flush_calls=100, flush_rows=100000,
+                 flush_interval=60, on_flush=None, clock=time.monotonic):
+        self.bucket = bucket
+        self.batch_id = batch_id
+        self.s3 = s3 if s3 is not None else get_client('s3')
+        self.prefix = prefix
+        self.flush_calls = flush_calls
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.on_flush = on_flush
+        self.clock = clock
+        self.rows = {'objection-scores': [], 'call-analytics': []}
+        self.files = 0
+        # calls added since the last flush, and when that was
+        self._calls = 0
+        self._flushed_at = clock()
+        self._lock = threading.Lock()
+
+    def _add(self, table, rows, date):
+        for row in rows:
+            row['date'] = date or NO_DATE_PARTITION
+        with self._lock:
+            self.rows[table] += rows
+            if table == 'objection-scores':
+                self._calls += 1
+            due = (self._calls >= self.flush_calls
+                   or sum(len(buffered) for buffered in self.rows.values()) >= self.flush_rows
+                   or self.clock() - self._flushed_at >= self.flush_interval)
+        if due:
+            self.flush()
+
+    def add_scores(self, tracking_guid, responses, dead_responses=(), date=None, agent=None):
+        self._add('objection-scores', score_rows(tracking_guid, responses, dead_responses, agent), date)
+
+    def add_analytics(self, tracking_guid, analytics, date=None):
+        self._add('call-analytics', [{'tracking_guid': tracking_guid, **analytics}], date)
+
+    def partition_prefix(self, table, date=None):
+        prefix = f"{self.prefix}/{table}/batch_id={self.batch_id}/"
+        return prefix if date is None else f"{prefix}date={date}/"
+
+    def flush(self):
+        """
+        Writes out everything buffered. Rows that fail to write are kept for the next flush.
+        Returns:
+            list: the keys written.
+        """
+        with self._lock:
+            pending, self.rows = self.rows, {table: [] for table in self.rows}
+            self._calls = 0
+            self._flushed_at = self.clock()
+        keys = []
+        error = None
+        for table, rows in pending.items():
+            if not rows:
+                continue
+            schema = RESULT_SCHEMAS[table]
+            df = pd.DataFrame(rows).reindex(columns=schema.names + ['date'])
+            for field in schema:
+                if pa.types.is_floating(field.type):
+                    df[field.name] = pd.to_numeric(df[field.name], errors='coerce')
+                elif pa.types.is_string(field.type):
+                    df[field.name] = df[field.name].astype('string')
+            for date, part in df.groupby('date', sort=True):
+                # the nanosecond clock first, so a later write of the same call sorts after an earlier one
+                # even when s3's LastModified (whole seconds) is the same
+                key = f"{self.partition_prefix(table, date)}part-{time.time_ns()}-{uuid.uuid4().hex}.parquet"
+                buffer = io.BytesIO()
+                pq.write_table(pa.Table.from_pandas(part.drop(columns=['date']), schema=schema, preserve_index=False),
+                               buffer)
+                try:
+                    self.s3.put_object(Body=buffer.getvalue(), Bucket=self.bucket, Key=key)
+                except Exception as e:
+                    print(f"Failed to write {len(part)} rows to s3://{self.bucket}/{key}", e)
+                    error = error or e
+                    with self._lock:
+                        self.rows[table] += [rows[i] for i in part.index]
+                    continue
+                print(f"Wrote {len(part)} rows to s3://{self.bucket}/{key}")
+                self.files += 1
+                keys.append(key)
+                if self.on_flush:
+                    self.on_flush(table, key, part['tracking_guid'].unique().tolist())
+        if error is not None:
+            raise error
+        return keys
+
+    def close(self):
+        return self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_results(bucket, prefix=f'{RESULTS_PREFIX}/objection-scores/', s3=None, max_workers=32):
+    """
+    Loads scored calls under s3://bucket/prefix into one DataFrame, one row per objection (see score_rows).
+    Reads both the parquet files ResultSink writes (batch_id and date come from the key) and the
+    older objection-scoring/batchid_<batch_id>/<tracking_guid>.json objects, fetched concurrently.
+    A call that was written more than once (a run that died after writing it but before recording
+    that) keeps only the rows from its newest file, by LastModified and then by key, since
+    LastModified only has whole seconds and ResultSink's keys sort in write order.
+    """
+    if s3 is None:
+        s3 = get_client('s3')
+    objects = [obj for obj in list_objects(bucket, prefix, s3) if obj['Key'].endswith(('.parquet', '.json'))]
+
+    def load(obj):
+        body = s3.get_object(Bucket=bucket, Key=obj['Key'])['Body'].read()
+        partitions = dict(part.split('=', 1) for part in obj['Key'].split('/') if '=' in part)
+        legacy_batch = re.search(r'batchid_([^/]+)/', obj['Key'])
+        columns = {
+            'batch_id': partitions.get('batch_id') or (legacy_batch.group(1) if legacy_batch else None),
+            'date': partitions.get('date'),
+            'modified': obj['LastModified'],
+            'key': obj['Key'],
+        }
+        if obj['Key'].endswith('.parquet'):
+            return pd.read_parquet(io.BytesIO(body)).assign(**columns)
+        data = json.loads(body)
+        return [{**row, **columns} for row in score_rows(data['tracking_guid'], data.get('responses', []),
+                                                        data.get('dead_responses', []), data.get('agent'))]
+
+    results = run_ordered(load, objects, max_workers=max_workers)
+    frames = []
+    rows = []
+    for result in results:
+        if result['error'] is not None:
+            raise result['error']
+        if isinstance(result['result'], list):
+            rows += result['result']
+        else:
+            frames.append(result['result'])
+    columns = list(OBJECTION_SCORE_COLUMNS) + ['batch_id', 'date', 'modified', 'key']
+    frames.append(pd.DataFrame(rows, columns=columns))
+    df = pd.concat([frame.reindex(columns=columns) for frame in frames], ignore_index=True)
+    df = df.astype({**result_dtypes('objection-scores'), 'batch_id': 'string', 'date': 'string'})
+    df['modified'] = pd.to_datetime(df['modified'], utc=True)
+    newest = (df.sort_values(['modified', 'key'])
+              .groupby(['batch_id', 'tracking_guid'], dropna=False)['key'].transform('last'))
+    df = df[df['key'] == newest].drop(columns=['key']).reset_index(drop=True)
+    print(f"Loaded {len(df)} rows for {df['tracking_guid'].nunique()} calls from {len(objects)} files")
+    return df
+
+
+def aggregate_scores(df, agent_column='agent'):
+    """
+    Score aggregates over load_results output, all computed with group-bys.
+    The agent comes from the call log's CALL_LOG_AGENT_COLUMN, written into each score row.
+    Returns:
+        dict: 'by_objection', 'by_batch' and, if any call has an agent, 'by_agent' DataFrames with
+        calls, objections, mean_score (over objections), mean_call_score (the average of each call's
+        average, like calculate_objection_score) and min/max scores.
+    """
+    scored = df[df['score'].notna()]
+
+    def aggregate(keys, per_call=True):
+        out = df.groupby(keys).agg(calls=('tracking_guid', 'nunique'))
+        out = out.join(scored.groupby(keys).agg(objections=('score', 'size'), mean_score=('score', 'mean'),
+                                                min_score=('score', 'min'), max_score=('score', 'max')))
+        if per_call:
+            call_means = scored.groupby(keys + ['tracking_guid'])['score'].mean()
+            out = out.join(call_means.groupby(level=keys).mean().rename('mean_call_score'))
+        out['objections'] = out['objections'].fillna(0).astype('int64')
+        return out.reset_index()
+
+    aggregates = {
+        'by_objection': aggregate(['objection_id'], per_call=False),
+        'by_batch': aggregate(['batch_id']),
+    }
+    if agent_column in df.columns and df[agent_column].notna().any():
+        aggregates['by_agent'] = aggregate([agent_column])
+    return aggregates
+
+
 def calculate_objection_score(data):
     total_score = 0
     num_objects = len(data)
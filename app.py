@@ -1,8 +1,15 @@
-import boto3
-from ProcessingMethods import fetch_call_log, get_call_urls, download_mp3_from_html, start_transcription_job, \
+from ProcessingMethods import iter_call_log, download_mp3_from_html, \
     get_conversation, analyze_post_call_analytics, create_objection_scoring_prompt, start_call_analytics_job, \
-    invoke_model, generate_score_responses
-import time, os, json
+    invoke_model, generate_score_responses, download_recordings, stream_recordings_to_s3, \
+    s3_https_uri, fetch_recording, stream_recording_to_s3, get_recording_sid, \
+    make_http_session, HostLimiter, BufferPool, PIPELINE_DONE, start_pipeline_stage, start_transcription_stage, \
+    BatchStateStore, reached, hash_file, BedrockRateLimiter, run_ordered, run_batch_scoring, \
+    build_scoring_prompts, merge_score_responses, SCORING_WINDOW_TOKENS, ObjectionLibraryIndex, \
+    generate_packed_score_responses, estimate_tokens, SHORT_CALL_TOKENS, ResultSink, get_client, client_stats, \
+    get_transcript, local_call_analytics, TALK_MERGE_GAP_MS, SILENCE_MIN_MS, ObjectionPrescreen, TranscriptionJobScheduler, MAX_TRANSCRIPTION_JOBS, \
+    MAX_TRANSCRIPTION_ATTEMPTS, transcription_job_name, \
+    upload_recordings, recording_key, UPLOAD_TRANSFER_CONFIG, get_recording_url_resolver, call_with_retries
+import time, os, json, queue, threading, re
 
 """
 
@@ -31,7 +38,39 @@ scoring_example = [{
 }]
 
 with open('objection-library.json', 'r') as f:
-    objection_library = f.read()
+    objection_library = json.load(f)
+# each prompt only carries the library entries relevant to that call
+objection_index = ObjectionLibraryIndex(objection_library)
+LIBRARY_TOP_K = 8
+# calls where the customer never says anything objection-like skip the model
+objection_prescreen = ObjectionPrescreen(objection_library)
+NO_OBJECTIONS = ([[]], [])
+
+
+def library_report(before):
+    # what objection_index.select has saved since the stats() in before
+    after = objection_index.stats()
+    return (f"objection library trimmed for {after['calls'] - before['calls']} prompts, "
+            f"~{after['tokens_saved'] - before['tokens_saved']} prompt tokens saved")
+
+
+def has_scores(record, prescreen=False):
+    # scored already, and not just skipped by the prescreen when this run doesn't prescreen
+    return reached(record, 'scored') and (prescreen or not record.get('prescreened'))
+
+
+def get_conversation_to_score(transcript_uri, prescreen=False):
+    """
+    The turns worth sending to the model for this call: with prescreen, only the turns around
+    the customer's candidate objections, or None if there aren't any.
+    """
+    transcript = get_transcript(transcript_uri)
+    if not prescreen:
+        return transcript.turns()
+    candidates = objection_prescreen.candidates(transcript)
+    if not candidates:
+        return None
+    return objection_prescreen.excerpt(transcript, candidates)
 
 
 def run(
@@ -39,83 +78,174 @@ def run(
         call_log_object_key,
         mp3_upload_bucket,
         duration_threshold,
-        batch_id):
-    # fetch call log csv from s3
-    call_log_df = fetch_call_log(call_log_bucket, call_log_object_key)
-    call_urls = get_call_urls(call_log_df, duration_threshold)
-    transcription_job_ids = []
-    call_analytics_job_ids = []
-    transcription_job_output_uris = []
+        batch_id,
+        download_audio=True,
+        download_workers=16,
+        upload_workers=16,
+        staging='disk',
+        state=None,
+        scoring_backend='invoke',
+        batch_role_arn=None,
+        max_transcription_jobs=MAX_TRANSCRIPTION_JOBS):
+    """
+    staging='disk' downloads the recordings into mp3-downloads/ and uploads them from there,
+    staging='stream' pipes them from the source straight into s3 without local files.
+    Either way they land under recordings/date=<call date>/ in mp3_upload_bucket.
+    Each call's progress is recorded in state (a BatchStateStore, batch-state.db by default),
+    so running the same batch_id again carries on where the last run stopped.
+    Transcription jobs go through a TranscriptionJobScheduler, so no more than max_transcription_jobs
+    run at once and the longest calls start first.
+    scoring_backend and batch_role_arn are passed on to process_transcription_outputs,
+    whose report is returned.
+    """
+    if state is None:
+        state = BatchStateStore()
+    # stream the call log csv from s3, keeping only the calls long enough to score
+    call_urls = list(iter_call_log(call_log_bucket, call_log_object_key, duration_threshold))
     call_analytics_job_output_uris = []
-    transcribe = boto3.client('transcribe', region_name='us-east-1')
-    # for call_url in call_urls:
-    #     print(f"Downloading mp3 from {call_url['url']}")
-    #     save_path = f"mp3-downloads/{call_url['url'].split('=')[-1]}.mp3"
-    #     file_path = download_mp3_from_html(call_url['url'], save_path)
-    #     # upload mp3 file at save_path to s3
-    #     #TODO: partition the key by date
-    #     print(f"Uploading {file_path} to {mp3_upload_bucket}")
-    #     # write python os command to list files in the mp3-downloads folder
-    files = os.listdir('mp3-downloads')
-    s3 = boto3.client('s3', region_name='us-east-1')
-    for file_path in files:
-        f = f'mp3-downloads/{file_path}'
-        resp = s3.upload_file(f, mp3_upload_bucket, file_path)
-        if resp is not None:
-            print(f"Failed to upload {file_path} to {call_log_bucket}")
-        else:
-            print(f"Uploaded {file_path} to {mp3_upload_bucket}")
-            # start transcriptoin jobs
-            job_name = file_path.split('/')[-1].split('.')[0]
-            job_name = f"{job_name}-{batch_id}"
-            media_s3_uri = f"s3://{mp3_upload_bucket}/{file_path}"
-            output_bucket = mp3_upload_bucket
-            output_key = f"transcription-outputs/batchid_{batch_id}/{job_name}.json"
-            transcription_job_response = start_transcription_job(job_name, media_s3_uri, output_bucket, output_key)
-            # call_analytics_job_response = start_call_analytics_job(job_name, media_s3_uri, output_bucket)
-            transcription_job_ids.append(transcription_job_response['TranscriptionJob']['TranscriptionJobName'])
-            # call_analytics_job_ids.append(call_analytics_job_response['CallAnalyticsJob']['CallAnalyticsJobName'])
-    completed_transcription_jobs = set()
-    # completed_call_analytics_jobs = set()
-
-    processing_complete = False
-    while not processing_complete:
-        for job_id in transcription_job_ids:
-            if job_id not in completed_transcription_jobs:
-                response = transcribe.get_transcription_job(
-                    TranscriptionJobName=job_id
-                )
-                if response['TranscriptionJob']['TranscriptionJobStatus'] in ['COMPLETED', 'FAILED']:
-                    try:
-                        transcription_job_output_uris.append(
-                            response['TranscriptionJob']['Transcript']['TranscriptFileUri'])
-                    except:
-                        print('Transcription job failed')
-                    completed_transcription_jobs.add(job_id)
-        #
-        # for job_id in call_analytics_job_ids:
-        #     if job_id not in completed_call_analytics_jobs:
-        #         response = transcribe.get_call_analytics_job(
-        #             CallAnalyticsJobName=job_id
-        #         )
-        #         if response['CallAnalyticsJob']['CallAnalyticsJobStatus'] in ['COMPLETED', 'FAILED']:
-        #             try:
-        #                 call_analytics_job_output_uris.append(response['CallAnalyticsJob']['Transcript']['TranscriptFileUri'])
-        #             except:
-        #                 print('Call analytics job failed')
-        #             completed_call_analytics_jobs.add(job_id)
-
-        if len(completed_transcription_jobs) == len(transcription_job_ids):
-            processing_complete = True
-            break
+    transcribe = get_client('transcribe', 'us-east-1')
+    s3 = get_client('s3', 'us-east-1')
+    to_upload = [c for c in call_urls if not reached(state.get(batch_id, c['tracking_guid']), 'uploaded')]
+    if staging == 'stream':
+        results = stream_recordings_to_s3(to_upload, mp3_upload_bucket, max_workers=download_workers, s3=s3)
+        for result in results:
+            if result['error'] is None:
+                state.advance(batch_id, result['call']['tracking_guid'], 'uploaded', key=result['key'],
+                              content_hash=result['sha256'])
+    else:
+        if download_audio:
+            # already-downloaded files are skipped and partial ones resumed
+            results = download_recordings(to_upload, 'mp3-downloads', max_workers=download_workers)
+            for result in results:
+                if result['error'] is None:
+                    state.advance(batch_id, result['call']['tracking_guid'], 'downloaded',
+                                  content_hash=result['sha256'])
+        pending = []
+        for call_url in to_upload:
+            f = f"mp3-downloads/{get_recording_sid(call_url['url'])}.mp3"
+            if not os.path.exists(f):
+                continue
+            record = state.get(batch_id, call_url['tracking_guid']) or {}
+            content_hash = record.get('content_hash') or hash_file(f).hexdigest()
+            if reuse_prior_outputs(state, batch_id, call_url['tracking_guid'], content_hash):
+                continue
+            pending.append((call_url, content_hash))
+        # recordings already in the bucket from an earlier run are skipped
+        results = upload_recordings([call_url for call_url, _ in pending], mp3_upload_bucket, 'mp3-downloads',
+                                    max_workers=upload_workers, s3=s3)
+        for (call_url, content_hash), result in zip(pending, results):
+            if result['error'] is None:
+                state.advance(batch_id, call_url['tracking_guid'], 'uploaded', key=result['key'],
+                              content_hash=content_hash)
+    # find finished jobs in bulk, and only start new ones as running ones finish
+    started = {}
+
+    def job_started(job):
+        for tracking_guid in job['tracking_guids']:
+            state.advance(batch_id, tracking_guid, 'job_started', job_name=job['job_name'],
+                          output_key=job['output_key'], job_created=job['created'])
+            started.setdefault(job['job_name'], []).append({'tracking_guid': tracking_guid, 'output_key': job['output_key'],
+                                                            'content_hash': job['content_hash']})
+        state.record_audio(job['content_hash'], job_name=job['job_name'], output_key=job['output_key'],
+                           job_created=job['created'])
 
-        # Optionally, add a sleep interval to avoid excessive API calls
-        time.sleep(10)
-        print('Waiting for transcription and call analytics jobs to complete')
-    # do something else
-    # get the outputs
-    process_transcription_outputs(transcription_job_output_uris, call_analytics_job_output_uris, batch_id)
-    return
+    scheduler = TranscriptionJobScheduler(transcribe, max_in_flight=max_transcription_jobs, name_contains=batch_id,
+                                          on_start=job_started)
+    queued = {}  # content hash -> job, so calls with the same recording share one
+    for call_url in call_urls:
+        record = state.get(batch_id, call_url['tracking_guid'])
+        if not reached(record, 'uploaded') or reached(record, 'job_started'):
+            continue
+        content_hash = record.get('content_hash')
+        if reuse_prior_outputs(state, batch_id, call_url['tracking_guid'], content_hash):
+            continue
+        if record.get('job_attempts', 0) >= MAX_TRANSCRIPTION_ATTEMPTS:
+            print('Not transcribing', call_url['tracking_guid'], 'again, its last job failed:',
+                  record.get('failure_reason'))
+            continue
+        prior = state.lookup_audio(content_hash)
+        if prior and (prior.get('job_name') or '').endswith(f'-{batch_id}'):
+            # same recording as another call in this batch, share its job
+            state.advance(batch_id, call_url['tracking_guid'], 'job_started', job_name=prior['job_name'],
+                          output_key=prior['output_key'], job_created=prior.get('job_created'))
+            continue
+        if content_hash and content_hash in queued:
+            queued[content_hash]['tracking_guids'].append(call_url['tracking_guid'])
+            continue
+        file_path = record['key']
+        # queue transcriptoin jobs
+        job_name = file_path.split('/')[-1].split('.')[0]
+        job_name = transcription_job_name(job_name, batch_id, record.get('job_attempts', 0))
+        media_s3_uri = f"s3://{mp3_upload_bucket}/{file_path}"
+        output_bucket = mp3_upload_bucket
+        output_key = f"transcription-outputs/batchid_{batch_id}/{job_name}.json"
+        job = scheduler.add(job_name, media_s3_uri, output_bucket, output_key, duration=call_url['duration'],
+                            tracking_guids=[call_url['tracking_guid']], content_hash=content_hash)
+        if content_hash:
+            queued[content_hash] = job
+        # call_analytics_job_response = start_call_analytics_job(job_name, media_s3_uri, output_bucket)
+        # call_analytics_job_ids.append(call_analytics_job_response['CallAnalyticsJob']['CallAnalyticsJobName'])
+    # jobs started by a previous run; their CreationTime lets the tracker stop listing at them
+    for record in state.calls(batch_id, 'job_started'):
+        started.setdefault(record['job_name'], []).append(record)
+        scheduler.track(record['job_name'], record.get('job_created'))
+    for job, summary in scheduler.run():
+        if job is not None and job['job_name'] not in started:
+            # never started, the calls stay 'uploaded' for the next run to try again
+            print('Could not start transcription job', job['job_name'], summary.get('FailureReason'))
+            continue
+        for record in started[summary['TranscriptionJobName']]:
+            if summary['TranscriptionJobStatus'] == 'COMPLETED':
+                transcript_uri = s3_https_uri(mp3_upload_bucket, record['output_key'])
+                state.advance(batch_id, record['tracking_guid'], 'transcribed', transcript_uri=transcript_uri)
+                state.record_audio(record.get('content_hash'), transcript_uri=transcript_uri)
+            else:
+                record_job_failed(state, batch_id, record['tracking_guid'], record.get('content_hash'),
+                                  summary['TranscriptionJobName'], summary.get('FailureReason'))
+        print(f'{len(scheduler.queue)} transcription jobs queued, {len(scheduler.tracker.pending)} still running')
+    # score and write out everything that's transcribed but not written yet, including leftovers from a previous run
+    records = state.calls(batch_id, 'transcribed') + state.calls(batch_id, 'scored')
+    report = process_transcription_outputs([r['transcript_uri'] for r in records], call_analytics_job_output_uris,
+                                           batch_id, mp3_upload_bucket, state=state,
+                                           tracking_guids=[r['tracking_guid'] for r in records],
+                                           scoring_backend=scoring_backend, batch_role_arn=batch_role_arn,
+                                           call_dates={c['tracking_guid']: c['date'] for c in call_urls},
+                                           call_agents={c['tracking_guid']: c.get('agent') for c in call_urls})
+    print('AWS calls:', client_stats())
+    return report
+
+
+def record_job_failed(state, batch_id, tracking_guid, content_hash, job_name, failure_reason):
+    """
+    Marks the call job_failed, so the next run of the batch starts it again under a new job name,
+    and takes the failed job out of the content-hash index so no other call shares it.
+    """
+    attempts = state.job_failed(batch_id, tracking_guid, failure_reason)
+    prior = state.lookup_audio(content_hash)
+    if prior and prior.get('job_name') == job_name:
+        state.record_audio(content_hash, job_name=None, output_key=None, job_created=None)
+    retry = 'giving up' if (attempts or 0) >= MAX_TRANSCRIPTION_ATTEMPTS else 'retried on the next run'
+    print('Transcription job failed', job_name, failure_reason, f'({tracking_guid} {retry})')
+
+
+def reuse_prior_outputs(state, batch_id, tracking_guid, content_hash):
+    """
+    If this exact recording (by content hash) has already been transcribed, in this batch or any
+    other, moves the call straight to 'transcribed' - or 'scored', if the scores are known too -
+    so it isn't transcribed or sent to the model again.
+    Returns:
+        bool: True if prior outputs were reused.
+    """
+    prior = state.lookup_audio(content_hash)
+    if not prior or not prior.get('transcript_uri'):
+        return False
+    print(f"{tracking_guid} is a repeat recording, reusing {prior['transcript_uri']}")
+    state.advance(batch_id, tracking_guid, 'transcribed', content_hash=content_hash,
+                  transcript_uri=prior['transcript_uri'])
+    if prior.get('responses'):
+        state.advance(batch_id, tracking_guid, 'scored', responses=prior['responses'],
+                      dead_responses=prior.get('dead_responses', []))
+    return True
 
 
 def get_guid_from_uri(uri):
@@ -137,82 +267,621 @@ def process_transcription_outputs(
         call_analytics_job_output_uris,
         batch_id,
         # mp3_upload_bucket='synergy-sandbox-us-east-1-905418409497'
-        mp3_upload_bucket='cdk-hnb659fds-assets-466568757406-us-east-1'
+        mp3_upload_bucket='cdk-hnb659fds-assets-466568757406-us-east-1',
+        state=None,
+        tracking_guids=None,
+        limiter=None,
+        scoring_backend='invoke',
+        batch_role_arn=None,
+        pack_short_calls=False,
+        call_dates=None,
+        call_agents=None,
+        result_format='parquet',
+        local_analytics=True,
+        prescreen=False,
+        talk_merge_gap_ms=TALK_MERGE_GAP_MS,
+        silence_min_ms=SILENCE_MIN_MS
 ):
-    s3 = boto3.client('s3')
-    for transcription_output_uri in transcription_job_output_uris:
-        conversation = get_conversation(transcription_output_uri)
+    """
+    Scores the transcripts in parallel through a shared BedrockRateLimiter (one is made if not
+    given), then writes each call's scores to s3 in order. scoring_backend='batch' sends all the
+    prompts as one bedrock batch inference job instead (needs batch_role_arn); that's slower to come
+    back but much cheaper for overnight backfills.
+    pack_short_calls=True scores short calls several to a request (see generate_packed_score_responses).
+    With a BatchStateStore as state, calls already written are skipped and calls already
+    scored are written without scoring them again. tracking_guids, if given, lines up with
+    transcription_job_output_uris; otherwise the guid is taken from the uri.
+    Results go to a ResultSink as parquet partitioned by batch and call date (call_dates maps
+    tracking_guid to the call log date, call_agents to its agent for aggregate_scores);
+    result_format='json' writes the old one object per call instead.
+    local_analytics=True also works out each call's talk/silence metrics from the transcript's word
+    timings (local_call_analytics, with talk_merge_gap_ms and silence_min_ms), so no call analytics
+    jobs are needed for them. Calls that have a call analytics output in call_analytics_job_output_uris
+    get their analytics from that instead, so each call has one analytics row.
+    prescreen=True only sends the turns around the customer's likely objections to the model, and
+    calls with none are recorded as having no objections without a model call (ObjectionPrescreen).
+    That's cheaper, but an objection worded unlike anything in the library is missed, so it's off by
+    default. A call skipped that way is marked prescreened and its result is never reused as model
+    scores: a later run without prescreen scores it properly.
+    Returns:
+        dict: 'written', 'failed' and 'unparseable' (model answered, but not with usable json)
+        lists of {'tracking_guid': ..., ...} so the batch can report on them.
+    """
+    s3 = get_client('s3')
+    if limiter is None:
+        limiter = BedrockRateLimiter()
+    # the index is shared by every batch in the process, this one's savings are the difference
+    library_before = objection_index.stats()
+    # work out what's left for every call first, so the model calls can all run at once
+    calls = []
+    for i, transcription_output_uri in enumerate(transcription_job_output_uris):
         # get the tracking_guid from the uri
-        tracking_guid = get_guid_from_uri(transcription_output_uri)
-        print('tracking_guid', tracking_guid)
+        tracking_guid = tracking_guids[i] if tracking_guids else get_guid_from_uri(transcription_output_uri)
+        record = state.get(batch_id, tracking_guid) if state else None
+        if reached(record, 'written'):
+            print('Already written', tracking_guid)
+            continue
+        calls.append({'uri': transcription_output_uri, 'tracking_guid': tracking_guid, 'record': record})
+
+    def known_scores(call):
+        record = call['record']
+        if has_scores(record, prescreen):
+            return record['responses'], record['dead_responses']
+        # a repeat of a recording that's already been scored, in this batch or another
+        prior = state.lookup_audio(record.get('content_hash')) if record else None
+        if prior and prior.get('responses'):
+            return prior['responses'], prior.get('dead_responses', [])
+        return None
+
+    def score(call):
+        known = known_scores(call)
+        if known is not None:
+            return known
         # run a couple models and prompts
+        conversation = get_conversation_to_score(call['uri'], prescreen)
+        if conversation is None:
+            return NO_OBJECTIONS
+        library = objection_index.select(conversation, LIBRARY_TOP_K)
+        return generate_score_responses(conversation, library, scoring_example, limiter=limiter,
+                                        max_prompt_tokens=SCORING_WINDOW_TOKENS)
+
+    report = {'written': [], 'failed': [], 'unparseable': []}
+    call_dates = call_dates or {}
+    call_agents = call_agents or {}
+
+    def mark_written(table, key, written_guids):
+        if table != 'objection-scores':
+            return
+        for tracking_guid in written_guids:
+            if state:
+                state.advance(batch_id, tracking_guid, 'written', result_key=key)
+            report['written'].append({'tracking_guid': tracking_guid, 'result_key': key})
+
+    sink = ResultSink(mp3_upload_bucket, batch_id, s3, on_flush=mark_written)
+    if scoring_backend == 'batch':
+        results = batch_score(calls, known_scores, mp3_upload_bucket, batch_id, batch_role_arn,
+                              prescreen=prescreen)
+    elif pack_short_calls:
+        results = packed_score(calls, known_scores, limiter, prescreen=prescreen)
+    else:
+        results = run_ordered(score, calls, max_workers=limiter.max_concurrency)
+    for call, result in zip(calls, results):
+        tracking_guid = call['tracking_guid']
+        print('tracking_guid', tracking_guid)
+        if result['error'] is not None:
+            print('Failed to generate score responses', tracking_guid, result['error'])
+            report['failed'].append({'tracking_guid': tracking_guid, 'error': repr(result['error'])})
+            continue
+        responses, dead_responses = result['result']
+        # no model call was made, so nothing to share with other calls of the same recording
+        prescreened = result['result'] is NO_OBJECTIONS
+        if state and not has_scores(call['record'], prescreen):
+            state.advance(batch_id, tracking_guid, 'scored', responses=responses, dead_responses=dead_responses,
+                          prescreened=prescreened)
+            if responses and not prescreened:
+                state.record_audio((call['record'] or {}).get('content_hash'), responses=responses,
+                                   dead_responses=dead_responses)
+        if dead_responses:
+            report['unparseable'].append({'tracking_guid': tracking_guid, 'dead_responses': dead_responses})
+
+        print('Generated responses:', responses)
+        print('Generated dead responses:', dead_responses)
+        if result_format == 'parquet':
+            try:
+                sink.add_scores(tracking_guid, responses, dead_responses, date=call_dates.get(tracking_guid),
+                                agent=call_agents.get(tracking_guid))
+            except Exception as e:
+                # the rows stay buffered and are tried again on the next flush
+                print('Failed to write score results', e)
+            continue
+        upload_file = {
+            "tracking_guid": tracking_guid,
+            "agent": call_agents.get(tracking_guid),
+            "responses": responses,
+            "dead_responses": dead_responses
+        }
         try:
-            responses, dead_responses = generate_score_responses(conversation, objection_library, scoring_example)
-
-            print('Generated responses:', responses)
-            print('Generated dead responses:', dead_responses)
-            upload_file = {
-                "tracking_guid": tracking_guid,
-                "responses": responses,
-                "dead_responses": dead_responses
-            }
-            # write json to s3
-            object_key = f"objection-scoring/batchid_{batch_id}/{tracking_guid}.json"
-            print('Uploading as:', object_key)
-            print('Uploading:', upload_file)
-            print('Uploading to:', mp3_upload_bucket)
-            # instead of upload_file, put_object
-            resp = s3.put_object(Body=json.dumps(upload_file), Bucket=mp3_upload_bucket, Key=object_key)
-            print('s3 Response:', resp)
-        except:
-            print('Failed to generate score responses', tracking_guid)
-        # attach to a df
+            object_key = write_objection_scores(s3, mp3_upload_bucket, batch_id, upload_file)
+        except Exception as e:
+            print('Failed to write score responses', tracking_guid, e)
+            report['failed'].append({'tracking_guid': tracking_guid, 'error': repr(e)})
+            continue
+        if state:
+            state.advance(batch_id, tracking_guid, 'written', result_key=object_key)
+        report['written'].append({'tracking_guid': tracking_guid, 'result_key': object_key})
+    try:
+        sink.flush()
+    except Exception as e:
+        print('Failed to write score results', e)
+    # whatever is still buffered didn't make it out
+    for tracking_guid in dict.fromkeys(row['tracking_guid'] for row in sink.rows['objection-scores']):
+        report['failed'].append({'tracking_guid': tracking_guid, 'error': 'result write failed'})
+    print(f"Wrote scores for {len(report['written'])} calls, {len(report['failed'])} failed, "
+          f"{len(report['unparseable'])} with unparseable model output "
+          f"({limiter.calls} model calls, {limiter.throttles} throttled, "
+          f"{library_report(library_before)}, "
+          f"{objection_prescreen.skipped} of {objection_prescreen.calls} calls pre-screened as objection-free)")
+    if local_analytics:
+        # call analytics' own numbers (with sentiment and categories) win where a call has them
+        analysed = {get_guid_from_uri(uri) for uri in call_analytics_job_output_uris}
+        local_calls = [call for call in calls if call['tracking_guid'] not in analysed]
+        analytics = run_ordered(lambda call: local_call_analytics(get_transcript(call['uri']),
+                                                                  merge_gap_ms=talk_merge_gap_ms,
+                                                                  silence_min_ms=silence_min_ms),
+                                local_calls, max_workers=limiter.max_concurrency)
+        for call, result in zip(local_calls, analytics):
+            tracking_guid = call['tracking_guid']
+            if result['error'] is not None:
+                print('Failed to work out analytics', tracking_guid, result['error'])
+                continue
+            if result_format == 'parquet':
+                sink.add_analytics(tracking_guid, result['result'], date=call_dates.get(tracking_guid))
+            else:
+                object_key = f"call-analytics-scoring/batchid_{batch_id}/{tracking_guid}.json"
+                s3.put_object(Body=json.dumps({"tracking_guid": tracking_guid, "analytics": result['result']}),
+                              Bucket=mp3_upload_bucket, Key=object_key)
     for call_analytics_output_uri in call_analytics_job_output_uris:
         # download the output
         analytics_dict = analyze_post_call_analytics(call_analytics_output_uri)
         tracking_guid = get_guid_from_uri(call_analytics_output_uri)
-        # attach this to a df??
         print('Analytics dict:', analytics_dict)
+        if result_format == 'parquet':
+            sink.add_analytics(tracking_guid, analytics_dict, date=call_dates.get(tracking_guid))
+            continue
         upload_file = {
             "tracking_guid": tracking_guid,
             "analytics": analytics_dict
         }
         object_key = f"call-analytics-scoring/batchid_{batch_id}/{tracking_guid}.json"
         s3.put_object(Body=json.dumps(upload_file), Bucket=mp3_upload_bucket, Key=object_key)
+    sink.close()
+    return report
 
 
-def get_transcription_outputs(batch_id):
-    job_names = []
-    transcription_job_output_uris = []
-    call_analytics_job_output_uris = []
-    transcribe = boto3.client('transcribe', region_name='us-east-1')
-    response = transcribe.list_transcription_jobs(MaxResults=5)
-    while 'NextToken' in response:
-        for job in response['TranscriptionJobSummaries']:
-            if batch_id in job['TranscriptionJobName']:
-                job_names.append(job['TranscriptionJobName'])
-        response = transcribe.list_transcription_jobs(NextToken=response['NextToken'])
-        if 'NextToken' not in response:
-            for job in response['TranscriptionJobSummaries']:
-                if batch_id in job['TranscriptionJobName']:
-                    job_names.append(job['TranscriptionJobName'])
-    for job_name in job_names:
-        response = transcribe.get_transcription_job(TranscriptionJobName=job_name)
-        transcription_job_output_uris.append(response['TranscriptionJob']['Transcript']['TranscriptFileUri'])
-    response = transcribe.list_call_analytics_jobs(MaxResults=5)
+def batch_score(calls, known_scores, bucket, batch_id, role_arn, bedrock=None, s3=None, poll_interval=60,
+                sleep=time.sleep, prescreen=False):
+    """
+    The scoring_backend='batch' half of process_transcription_outputs: fetches the transcripts,
+    builds every prompt, scores them all in one bedrock batch inference job and fans the answers
+    back out per call.
+    Returns:
+        list: {'result': (responses, dead_responses), 'error': ...} per call, like run_ordered.
+    """
+    if not role_arn:
+        raise ValueError("scoring_backend='batch' needs batch_role_arn")
+    results = [None] * len(calls)
+    to_score = []
+    for i, call in enumerate(calls):
+        known = known_scores(call)
+        if known is not None:
+            results[i] = {'result': known, 'error': None}
+        else:
+            to_score.append(i)
+    conversations = run_ordered(lambda i: get_conversation_to_score(calls[i]['uri'], prescreen), to_score)
+    prompts = {}
+    record_ids = {}
+    for i, conversation in zip(to_score, conversations):
+        if conversation['error'] is not None:
+            results[i] = conversation
+            continue
+        if conversation['result'] is None:
+            results[i] = {'result': NO_OBJECTIONS, 'error': None}
+            continue
+        # long calls become several windowed prompts, recordIds <guid>#<window>
+        guid = calls[i]['tracking_guid']
+        library = objection_index.select(conversation['result'], LIBRARY_TOP_K)
+        windows = build_scoring_prompts(conversation['result'], library, scoring_example, SCORING_WINDOW_TOKENS)
+        record_ids[i] = [f"{guid}#{n}" for n in range(len(windows))]
+        prompts.update(zip(record_ids[i], windows))
+    scores = run_batch_scoring(prompts, bucket, batch_id, role_arn, bedrock, s3, poll_interval, sleep) if prompts else {}
+    for i in to_score:
+        if results[i] is not None:
+            continue
+        if all(record_id in scores for record_id in record_ids[i]):
+            window_scores = [scores[record_id] for record_id in record_ids[i]]
+            merged = window_scores[0] if len(window_scores) == 1 else merge_score_responses(window_scores)
+            results[i] = {'result': merged, 'error': None}
+        else:
+            results[i] = {'result': None, 'error': RuntimeError('no output from the batch inference job')}
+    return results
+
+
+def packed_score(calls, known_scores, limiter, prescreen=False):
+    """
+    The pack_short_calls half of process_transcription_outputs: fetches the transcripts, scores the
+    short ones a few to a request and the rest one per request as usual.
+    Returns:
+        list: {'result': (responses, dead_responses), 'error': ...} per call, like run_ordered.
+    """
+    results = [None] * len(calls)
+    to_score = []
+    for i, call in enumerate(calls):
+        known = known_scores(call)
+        if known is not None:
+            results[i] = {'result': known, 'error': None}
+        else:
+            to_score.append(i)
+    conversations = run_ordered(lambda i: get_conversation_to_score(calls[i]['uri'], prescreen), to_score,
+                                max_workers=limiter.max_concurrency)
+    short = {}
+    long = []
+    for i, conversation in zip(to_score, conversations):
+        if conversation['error'] is not None:
+            results[i] = conversation
+        elif conversation['result'] is None:
+            results[i] = {'result': NO_OBJECTIONS, 'error': None}
+        elif estimate_tokens(str(conversation['result'])) <= SHORT_CALL_TOKENS:
+            short[calls[i]['tracking_guid']] = conversation['result']
+        else:
+            long.append((i, conversation['result']))
+
+    def score_long(item):
+        conversation = item[1]
+        library = objection_index.select(conversation, LIBRARY_TOP_K)
+        return generate_score_responses(conversation, library, scoring_example, limiter=limiter,
+                                        max_prompt_tokens=SCORING_WINDOW_TOKENS)
+
+    # a pack carries a few more library entries, since it covers several customers
+    packed = generate_packed_score_responses(short, lambda turns: objection_index.select(turns, LIBRARY_TOP_K + 4),
+                                             scoring_example, limiter=limiter,
+                                             max_workers=limiter.max_concurrency)
+    for (i, _), result in zip(long, run_ordered(score_long, long, max_workers=limiter.max_concurrency)):
+        results[i] = result
+    for i in to_score:
+        if results[i] is None:
+            results[i] = packed[calls[i]['tracking_guid']]
+    return results
+
+
+def write_objection_scores(s3, bucket, batch_id, upload_file):
+    # write json to s3
+    object_key = f"objection-scoring/batchid_{batch_id}/{upload_file['tracking_guid']}.json"
+    print('Uploading as:', object_key)
+    print('Uploading:', upload_file)
+    print('Uploading to:', bucket)
+    # instead of upload_file, put_object
+    resp = s3.put_object(Body=json.dumps(upload_file), Bucket=bucket, Key=object_key)
+    print('s3 Response:', resp)
+    return object_key
+
+
+DEFAULT_STAGE_WORKERS = {
+    'download': 16,
+    'upload': 8,
+    'start_job': 4,
+    'fetch_transcript': 8,
+    'score': 16,
+    'write': 4,
+}
+
+
+def run_pipeline(
+        call_log_bucket,
+        call_log_object_key,
+        mp3_upload_bucket,
+        duration_threshold,
+        batch_id,
+        workers=None,
+        queue_size=100,
+        staging='disk',
+        transcribe=None,
+        s3=None,
+        state=None,
+        result_format='parquet',
+        prescreen=False,
+        max_transcription_jobs=MAX_TRANSCRIPTION_JOBS,
+        local_analytics=True,
+        talk_merge_gap_ms=TALK_MERGE_GAP_MS,
+        silence_min_ms=SILENCE_MIN_MS):
+    """
+    Does the same work as run() + process_transcription_outputs(), but as a streaming pipeline:
+    download -> upload -> start job -> await completion -> fetch transcript -> score -> write result.
+    Stages are connected by bounded queues and each call moves through them on its own, so a call
+    is scored as soon as its own transcription finishes instead of waiting for the whole batch.
+    workers overrides DEFAULT_STAGE_WORKERS per stage. With staging='stream' the download and upload
+    stages become one stage that pipes the recording straight into s3. Like run(), progress is
+    kept in state (a BatchStateStore) and every stage skips the calls that already got past it.
+    Results are buffered in a ResultSink and marked written as its parquet files land, or with
+    result_format='json' written one object per call as before. prescreen, local_analytics,
+    talk_merge_gap_ms and silence_min_ms work as in process_transcription_outputs. As in run(),
+    jobs are started through a TranscriptionJobScheduler, so no more than max_transcription_jobs
+    run at once; calls wait in its queue rather than failing when the quota is used up.
+    Returns:
+        (list, list): the calls that made it all the way through, and (stage, call, exception)
+        for the ones that didn't.
+    """
+    workers = {**DEFAULT_STAGE_WORKERS, **(workers or {})}
+    # read lazily by the feed thread, so calls start downloading while the log is still streaming in
+    call_urls = iter_call_log(call_log_bucket, call_log_object_key, duration_threshold)
+    if transcribe is None:
+        transcribe = get_client('transcribe', 'us-east-1')
+    if s3 is None:
+        s3 = get_client('s3', 'us-east-1')
+    if state is None:
+        state = BatchStateStore()
+    local = threading.local()
+    host_limiter = HostLimiter(8)
+    resolver = get_recording_url_resolver()
+    buffer_pool = BufferPool(workers['download'])
+    limiter = BedrockRateLimiter(max_concurrency=workers['score'])
+    library_before = objection_index.stats()
+    errors = []
+
+    def session():
+        if not hasattr(local, 'session'):
+            local.session = make_http_session(8)
+        return local.session
+
+    def record(item):
+        return state.get(batch_id, item['call']['tracking_guid'])
+
+    def advance(item, stage, **fields):
+        state.advance(batch_id, item['call']['tracking_guid'], stage, **fields)
+
+    def download(item):
+        item['path'] = os.path.join('mp3-downloads', f"{item['sid']}.mp3")
+        if not reached(record(item), 'uploaded'):
+            _, content_hash = fetch_recording(item['call']['url'], item['path'], session(), host_limiter)
+            advance(item, 'downloaded', content_hash=content_hash)
+            # a repeat of a recording we've already transcribed doesn't need uploading either
+            reuse_prior_outputs(state, batch_id, item['call']['tracking_guid'], content_hash)
+        return item
+
+    def upload(item):
+        if not reached(record(item), 'uploaded'):
+            s3.upload_file(item['path'], mp3_upload_bucket, item['key'], Config=UPLOAD_TRANSFER_CONFIG)
+            advance(item, 'uploaded', key=item['key'])
+        return item
+
+    def stream(item):
+        if not reached(record(item), 'uploaded'):
+            _, content_hash = stream_recording_to_s3(item['call']['url'], mp3_upload_bucket, item['key'], session(),
+                                                     s3, buffer_pool, host_limiter)
+            advance(item, 'uploaded', key=item['key'], content_hash=content_hash)
+        return item
+
+    def start_job(item):
+        saved = record(item)
+        if saved.get('job_attempts', 0) >= MAX_TRANSCRIPTION_ATTEMPTS and not reached(saved, 'job_started'):
+            raise RuntimeError(f"not transcribing again, its last job failed: {saved.get('failure_reason')}")
+        item['job_name'] = transcription_job_name(item['sid'], batch_id, saved.get('job_attempts', 0))
+        item['output_key'] = f"transcription-outputs/batchid_{batch_id}/{item['job_name']}.json"
+        if not reached(saved, 'job_started'):
+            reuse_prior_outputs(state, batch_id, item['call']['tracking_guid'], saved.get('content_hash'))
+            saved = record(item)
+        if reached(saved, 'transcribed'):
+            # goes straight past the completion stage
+            item['job_status'] = 'COMPLETED'
+            item['transcript_uri'] = saved['transcript_uri']
+        elif reached(saved, 'job_started'):
+            item['job_name'], item['output_key'] = saved['job_name'], saved['output_key']
+            item['job_created'] = saved.get('job_created')
+        else:
+            prior = state.lookup_audio(saved.get('content_hash'))
+            if prior and (prior.get('job_name') or '').endswith(f'-{batch_id}'):
+                # same recording as another call in this batch, share its job
+                item['job_name'], item['output_key'] = prior['job_name'], prior['output_key']
+                item['job_created'] = prior.get('job_created')
+                advance(item, 'job_started', job_name=item['job_name'], output_key=item['output_key'],
+                        job_created=item['job_created'])
+            else:
+                # queued on the scheduler in the next stage, which starts it once there's room under the
+                # quota (job_started). the key it was uploaded under, in case that was before recordings
+                # were partitioned by date
+                item['media_s3_uri'] = f"s3://{mp3_upload_bucket}/{saved.get('key') or item['key']}"
+                item['output_bucket'] = mp3_upload_bucket
+                item['duration'] = item['call'].get('duration')
+                item['content_hash'] = saved.get('content_hash')
+        return item
+
+    def job_started(job):
+        for item in job['items']:
+            item['job_created'] = job['created']
+            advance(item, 'job_started', job_name=job['job_name'], output_key=job['output_key'],
+                    job_created=job['created'])
+        state.record_audio(job['items'][0].get('content_hash'), job_name=job['job_name'],
+                           output_key=job['output_key'], job_created=job['created'])
+
+    def fetch_transcript(item):
+        if item['job_status'] != 'COMPLETED':
+            record_job_failed(state, batch_id, item['call']['tracking_guid'], record(item).get('content_hash'),
+                              item['job_name'], item['failure_reason'])
+            raise RuntimeError(f"transcription job {item['job_name']} failed: {item['failure_reason']}")
+        if 'transcript_uri' not in item:
+            item['transcript_uri'] = s3_https_uri(mp3_upload_bucket, item['output_key'])
+            advance(item, 'transcribed', transcript_uri=item['transcript_uri'])
+            state.record_audio(record(item).get('content_hash'), transcript_uri=item['transcript_uri'])
+        if not has_scores(record(item), prescreen):
+            item['conversation'] = get_conversation_to_score(item['transcript_uri'], prescreen)
+        if local_analytics:
+            try:
+                item['analytics'] = local_call_analytics(get_transcript(item['transcript_uri']),
+                                                         merge_gap_ms=talk_merge_gap_ms, silence_min_ms=silence_min_ms)
+            except Exception as e:
+                # the scores are still worth having
+                print('Failed to work out analytics', item['call']['tracking_guid'], e)
+        return item
+
+    def score(item):
+        saved = record(item)
+        prior = state.lookup_audio(saved.get('content_hash'))
+        if has_scores(saved, prescreen):
+            item['responses'], item['dead_responses'] = saved['responses'], saved['dead_responses']
+        elif prior and prior.get('responses'):
+            item['responses'], item['dead_responses'] = prior['responses'], prior.get('dead_responses', [])
+            advance(item, 'scored', responses=item['responses'], dead_responses=item['dead_responses'],
+                    prescreened=False)
+        elif item['conversation'] is None:
+            # skipped by the prescreen, kept out of the content hash index (see process_transcription_outputs)
+            item['responses'], item['dead_responses'] = NO_OBJECTIONS
+            advance(item, 'scored', responses=item['responses'], dead_responses=item['dead_responses'],
+                    prescreened=True)
+        else:
+            library = objection_index.select(item['conversation'], LIBRARY_TOP_K)
+            item['responses'], item['dead_responses'] = generate_score_responses(
+                item['conversation'], library, scoring_example, limiter=limiter,
+                max_prompt_tokens=SCORING_WINDOW_TOKENS)
+            advance(item, 'scored', responses=item['responses'], dead_responses=item['dead_responses'],
+                    prescreened=False)
+            if item['responses']:
+                state.record_audio(saved.get('content_hash'), responses=item['responses'],
+                                   dead_responses=item['dead_responses'])
+        return item
+
+    def mark_written(table, key, written_guids):
+        if table == 'objection-scores':
+            for tracking_guid in written_guids:
+                state.advance(batch_id, tracking_guid, 'written', result_key=key)
+
+    sink = ResultSink(mp3_upload_bucket, batch_id, s3, on_flush=mark_written)
+
+    def write(item):
+        tracking_guid = item['call']['tracking_guid']
+        if result_format == 'parquet':
+            try:
+                if item.get('analytics') is not None:
+                    sink.add_analytics(tracking_guid, item['analytics'], date=item['call'].get('date'))
+                sink.add_scores(tracking_guid, item['responses'], item['dead_responses'],
+                                date=item['call'].get('date'), agent=item['call'].get('agent'))
+            except Exception as e:
+                # the rows stay buffered and are tried again on the next flush
+                print('Failed to write score results', e)
+            item.pop('conversation', None)
+            return item
+        if item.get('analytics') is not None:
+            s3.put_object(Body=json.dumps({"tracking_guid": tracking_guid, "analytics": item['analytics']}),
+                          Bucket=mp3_upload_bucket, Key=f"call-analytics-scoring/batchid_{batch_id}/{tracking_guid}.json")
+        item['result_key'] = write_objection_scores(s3, mp3_upload_bucket, batch_id, {
+            "tracking_guid": tracking_guid,
+            "agent": item['call'].get('agent'),
+            "responses": item['responses'],
+            "dead_responses": item['dead_responses'],
+        })
+        advance(item, 'written', result_key=item['result_key'])
+        # the transcript isn't needed anymore, don't hold on to it
+        item.pop('conversation', None)
+        return item
+
+    if staging == 'stream':
+        stages = [('stream', stream, workers['download'])]
+    else:
+        stages = [('download', download, workers['download']), ('upload', upload, workers['upload'])]
+    stages.append(('start_job', start_job, workers['start_job']))
+    stages.append(('transcribe', None, 1))
+    stages += [('fetch_transcript', fetch_transcript, workers['fetch_transcript']),
+               ('score', score, workers['score']),
+               ('write', write, workers['write'])]
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in range(len(stages) + 1)]
+    for (name, fn, num_workers), in_queue, out_queue in zip(stages, queues, queues[1:]):
+        if fn is None:
+            scheduler = TranscriptionJobScheduler(transcribe, max_in_flight=max_transcription_jobs,
+                                                  name_contains=batch_id, on_start=job_started)
+            start_transcription_stage(scheduler, in_queue, out_queue)
+        else:
+            start_pipeline_stage(name, fn, in_queue, out_queue, num_workers, errors)
+
+    fed = {'calls': 0}
+
+    def feed():
+        try:
+            for call_url in call_urls:
+                fed['calls'] += 1
+                if reached(state.get(batch_id, call_url['tracking_guid']), 'written'):
+                    continue
+                sid = get_recording_sid(call_url['url'])
+                if not reached(state.get(batch_id, call_url['tracking_guid']), 'uploaded'):
+                    # resolve the recording page while the call waits for a download worker
+                    resolver.prefetch([call_url['url']], host_limiter)
+                queues[0].put({'call': call_url, 'sid': sid, 'key': recording_key(call_url)})
+        except Exception as e:
+            # the call log couldn't be read (any further); finish what was fed
+            print('Failed reading the call log', e)
+            errors.append(('feed', None, e))
+        finally:
+            queues[0].put(PIPELINE_DONE)
+
+    threading.Thread(target=feed, name='feed', daemon=True).start()
+    finished = []
+    start = time.monotonic()
+    while True:
+        item = queues[-1].get()
+        if item is PIPELINE_DONE:
+            break
+        finished.append(item)
+        print(f"Finished {item['call']['tracking_guid']} ({len(finished)}/{fed['calls']}, "
+              f"{time.monotonic() - start:.1f}s)")
+    try:
+        sink.close()
+    except Exception as e:
+        # those calls stay 'scored' and are written on the next run
+        print('Failed to write score results', e)
+        errors.append(('write', None, e))
+    print(f"Pipeline done: {len(finished)} calls written, {len(errors)} failed "
+          f"({limiter.calls} model calls, {limiter.throttles} throttled, {library_report(library_before)})")
+    print('AWS calls:', client_stats())
+    return finished, errors
+
+
+def list_batch_job_names(list_jobs, summaries_key, name_key, batch_id):
+    """
+    Names of the COMPLETED jobs of this batch, asking transcribe to do the filtering (JobNameContains,
+    Status) 100 at a time. Names have to end in -<batch_id> exactly, so batch 1 doesn't pick up batch 10.
+    """
+    pattern = re.compile(rf'-{re.escape(batch_id)}$')
     job_names = []
-    while 'NextToken' in response:
-        for job in response['CallAnalyticsJobSummaries']:
-            if batch_id in job['CallAnalyticsJobName']:
-                job_names.append(job['CallAnalyticsJobName'])
-        response = transcribe.list_call_analytics_jobs(NextToken=response['NextToken'])
+    kwargs = {'JobNameContains': batch_id, 'Status': 'COMPLETED', 'MaxResults': 100}
+    while True:
+        response = call_with_retries(lambda: list_jobs(**kwargs))
+        job_names += [job[name_key] for job in response[summaries_key] if pattern.search(job[name_key])]
         if 'NextToken' not in response:
-            for job in response['CallAnalyticsJobSummaries']:
-                if batch_id in job['CallAnalyticsJobName']:
-                    job_names.append(job['CallAnalyticsJobName'])
-    for job_name in job_names:
-        response = transcribe.get_call_analytics_job(CallAnalyticsJobName=job_name)
-        call_analytics_job_output_uris.append(response['CallAnalyticsJob']['Transcript']['TranscriptFileUri'])
+            return job_names
+        kwargs['NextToken'] = response['NextToken']
+
+
+def get_transcription_outputs(
+        batch_id,
+        # mp3_upload_bucket='synergy-sandbox-us-east-1-905418409497'
+        mp3_upload_bucket='cdk-hnb659fds-assets-466568757406-us-east-1',
+        transcribe=None
+):
+    """
+    Finds the output uris of a batch's finished transcription and call analytics jobs, for
+    re-scoring a batch with process_transcription_outputs. The uris follow from the job names
+    (the keys run() and start_call_analytics_job write to), so there's no get_*_job call per job.
+    """
+    if transcribe is None:
+        transcribe = get_client('transcribe', 'us-east-1')
+    transcription_job_output_uris = [
+        s3_https_uri(mp3_upload_bucket, f"transcription-outputs/batchid_{batch_id}/{job_name}.json")
+        for job_name in list_batch_job_names(transcribe.list_transcription_jobs, 'TranscriptionJobSummaries',
+                                             'TranscriptionJobName', batch_id)
+    ]
+    call_analytics_job_output_uris = [
+        s3_https_uri(mp3_upload_bucket, f"call-analytics-output/analytics-{job_name}.json")
+        for job_name in list_batch_job_names(transcribe.list_call_analytics_jobs, 'CallAnalyticsJobSummaries',
+                                             'CallAnalyticsJobName', batch_id)
+    ]
     return transcription_job_output_uris, call_analytics_job_output_uris
 
 
@@ -222,6 +891,8 @@ if __name__ == "__main__":
     mp3_upload_bucket = 'cdk-hnb659fds-assets-466568757406-us-east-1'
     duration_threshold = 30
     batch_id = 'batch-1'
+    # run() scores and writes out the batch itself, and picks up where it left off if rerun.
+    # to re-score a batch that was run without the state store:
+    #   transcription_job_output_uris, call_analytics_job_output_uris = get_transcription_outputs(batch_id)
+    #   process_transcription_outputs(transcription_job_output_uris, call_analytics_job_output_uris, batch_id)
     run(call_log_bucket, call_log_object_key, mp3_upload_bucket, duration_threshold, batch_id)
-    transcription_job_output_uris, call_analytics_job_output_uris = get_transcription_outputs(batch_id)
-    process_transcription_outputs(transcription_job_output_uris, call_analytics_job_output_uris, batch_id)
@@ -0,0 +1,91 @@
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+import ProcessingMethods
+from LocalClients import LocalBedrockClient, LocalS3Client
+from ProcessingMethods import read_batch_scoring_outputs, run_batch_scoring
+
+# app.py reads objection-library.json from the working directory when it's imported
+_cwd = os.getcwd()
+os.chdir(ROOT)
+import app
+os.chdir(_cwd)
+
+OBJECTION = {'id': 'is-this-a-scam', 'actual_objection': 'Is this a scam?', 'agent_response': 'no', 'score': 4}
+
+
+def answer(text):
+    return {'outputs': [{'text': text, 'stop_reason': 'stop'}]}
+
+
+def respond(model_input):
+    # json for every prompt except the ones about g2
+    return answer('not json' if 'g2' in model_input['prompt'] else json.dumps([OBJECTION]))
+
+
+def input_records(s3):
+    return [json.loads(line) for (bucket, key), body in sorted(s3.objects.items())
+            if '/input/' in key for line in body.decode().splitlines() if line]
+
+
+def test_submits_polls_and_reads_back_every_prompt():
+    s3 = LocalS3Client()
+    bedrock = LocalBedrockClient(s3, respond, polls_to_complete=3)
+    sleeps = []
+    scores = run_batch_scoring({'g1': 'about g1', 'g2': 'about g2'}, 'bucket', 'batch-1', 'arn:role', bedrock, s3,
+                               poll_interval=60, sleep=sleeps.append)
+    assert [record['recordId'] for record in input_records(s3)] == ['g1', 'g2']
+    assert sleeps == [60, 60]
+    assert scores['g1'] == ([[OBJECTION]], [])
+    assert scores['g2'] == ([], [answer('not json')])
+
+
+def test_a_failed_job_raises():
+    s3 = LocalS3Client()
+
+    class FailingBedrock(LocalBedrockClient):
+        def get_model_invocation_job(self, jobIdentifier):
+            return {'jobArn': jobIdentifier, 'status': 'Failed', 'message': 'role not allowed'}
+
+    with pytest.raises(RuntimeError, match='role not allowed'):
+        run_batch_scoring({'g1': 'about g1'}, 'bucket', 'batch-1', 'arn:role', FailingBedrock(s3, respond), s3,
+                          sleep=lambda seconds: None)
+
+
+def test_leaves_out_records_without_output():
+    s3 = LocalS3Client()
+    lines = [{'recordId': 'g1', 'modelOutput': answer('[]')},
+             {'recordId': 'g2', 'error': {'errorCode': 400, 'errorMessage': 'too long'}}]
+    s3.put_object(Bucket='bucket', Key='out/0/part-00000.jsonl.out', Body='\n'.join(map(json.dumps, lines)) + '\n')
+    s3.put_object(Bucket='bucket', Key='out/0/manifest.json.out', Body='{"totalRecordCount": 2}')
+    assert read_batch_scoring_outputs('bucket', 'out/', s3) == {'g1': answer('[]')}
+
+
+def test_batch_score_windows_long_calls_and_fans_the_answers_back_out(monkeypatch):
+    with open(os.path.join(ROOT, 'normal-transcription.json')) as f:
+        turns = ProcessingMethods.Transcript.from_items(json.load(f)['results']['items']).turns()
+    conversations = {'uri-long': turns, 'uri-short': turns[:4], 'uri-none': None}
+    monkeypatch.setattr(app, 'get_conversation_to_score', lambda uri, prescreen=False: conversations[uri])
+    monkeypatch.setattr(app, 'SCORING_WINDOW_TOKENS', 2000)
+    s3 = LocalS3Client()
+    bedrock = LocalBedrockClient(s3, lambda model_input: answer(json.dumps([OBJECTION])))
+    calls = [{'tracking_guid': 'long', 'uri': 'uri-long'}, {'tracking_guid': 'known', 'uri': 'uri-known'},
+             {'tracking_guid': 'short', 'uri': 'uri-short'}, {'tracking_guid': 'none', 'uri': 'uri-none'}]
+    known = ([[OBJECTION]], ['earlier'])
+    results = app.batch_score(calls, lambda call: known if call['tracking_guid'] == 'known' else None,
+                              'bucket', 'batch-1', 'arn:role', bedrock, s3, sleep=lambda seconds: None)
+    record_ids = [record['recordId'] for record in input_records(s3)]
+    assert len([record_id for record_id in record_ids if record_id.startswith('long#')]) > 1
+    assert [record_id for record_id in record_ids if not record_id.startswith('long#')] == ['short#0']
+    assert [result['error'] for result in results] == [None] * 4
+    # the same objection in neighbouring windows is kept once
+    assert results[0]['result'] == ([[OBJECTION]], [])
+    assert results[1]['result'] == known
+    assert results[2]['result'] == ([[OBJECTION]], [])
+    assert results[3]['result'] is app.NO_OBJECTIONS
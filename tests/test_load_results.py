@@ -0,0 +1,68 @@
+import datetime
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from LocalClients import LocalS3Client
+from ProcessingMethods import ResultSink, aggregate_scores, load_results
+
+
+def objection(objection_id, score):
+    return {'id': objection_id, 'actual_objection': objection_id, 'score': score}
+
+
+def test_keeps_the_newest_file_of_a_call_written_twice_in_the_same_second():
+    s3 = LocalS3Client()
+    sink = ResultSink('bucket', 'batch-1', s3)
+    sink.add_scores('g1', [[objection('scam', 2)]])
+    sink.flush()
+    # a rerun wrote g1 again before the first run recorded it
+    sink.add_scores('g1', [[objection('scam', 8), objection('credit', 6)]])
+    sink.add_scores('g2', [[objection('scam', 5)]])
+    sink.flush()
+    # LastModified only has whole seconds
+    for key in s3.modified:
+        s3.modified[key] = datetime.datetime(2024, 5, 1, 12, 0, 0, tzinfo=datetime.timezone.utc)
+    df = load_results('bucket', s3=s3).sort_values(['tracking_guid', 'score'])
+    assert list(zip(df['tracking_guid'], df['score'])) == [('g1', 6.0), ('g1', 8.0), ('g2', 5.0)]
+
+
+def test_reads_the_old_json_layout():
+    s3 = LocalS3Client()
+    s3.put_object(Bucket='bucket', Key='objection-scoring/batchid_batch-0/g1.json', Body=json.dumps({
+        'tracking_guid': 'g1', 'agent': 'alice', 'responses': [[objection('scam', 7)]], 'dead_responses': []}))
+    s3.put_object(Bucket='bucket', Key='objection-scoring/batchid_batch-0/g2.json', Body=json.dumps({
+        'tracking_guid': 'g2', 'responses': [], 'dead_responses': ['not json']}))
+    df = load_results('bucket', prefix='objection-scoring/', s3=s3).sort_values('tracking_guid')
+    assert df['batch_id'].tolist() == ['batch-0', 'batch-0']
+    assert df['agent'].tolist()[0] == 'alice'
+    assert df['score'].tolist()[0] == 7.0
+    assert df['unparseable'].tolist() == [0, 1]
+
+
+def test_aggregates_per_objection_batch_and_agent():
+    s3 = LocalS3Client()
+    sink = ResultSink('bucket', 'batch-1', s3)
+    sink.add_scores('g1', [[objection('scam', 2), objection('scam', 4), objection('credit', 9)]], agent='alice')
+    sink.add_scores('g2', [[objection('scam', 6)]], agent='bob')
+    sink.add_scores('g3', [[]], agent='bob')
+    sink.flush()
+    aggregates = aggregate_scores(load_results('bucket', s3=s3))
+    by_objection = aggregates['by_objection'].set_index('objection_id')
+    assert by_objection.loc['scam', 'objections'] == 3 and by_objection.loc['scam', 'mean_score'] == 4.0
+    by_agent = aggregates['by_agent'].set_index('agent')
+    assert by_agent.loc['alice', 'mean_call_score'] == 5.0
+    assert by_agent.loc['bob', 'calls'] == 2 and by_agent.loc['bob', 'objections'] == 1
+    by_batch = aggregates['by_batch'].set_index('batch_id')
+    # the average of each call's average: (5 + 6) / 2
+    assert by_batch.loc['batch-1', 'calls'] == 3 and by_batch.loc['batch-1', 'mean_call_score'] == 5.5
+
+
+def test_no_agent_breakdown_without_agents():
+    s3 = LocalS3Client()
+    sink = ResultSink('bucket', 'batch-1', s3)
+    sink.add_scores('g1', [[objection('scam', 2)]])
+    sink.flush()
+    assert 'by_agent' not in aggregate_scores(load_results('bucket', s3=s3))
@@ -0,0 +1,85 @@
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ProcessingMethods import ObjectionPrescreen, PhraseMatcher, Transcript
+
+LIBRARY = [
+    {'id': 'is-this-a-scam', 'example_objection': "I'm not sure if this is real",
+     'keywords': ['scam', 'is this legit']},
+    {'id': 'credit-check', 'example_objection': 'will this hurt my credit', 'keywords': ['credit check']},
+]
+
+
+def make_transcript(turns):
+    # one item per word, a second each, plus the full stop transcribe adds at the end of a turn
+    items = []
+    for speaker, text in turns:
+        for word in text.split():
+            t = len(items)
+            items.append({'type': 'pronunciation', 'start_time': str(t), 'end_time': str(t + 1),
+                          'alternatives': [{'content': word, 'confidence': '0.9'}], 'speaker_label': speaker})
+        items.append({'type': 'punctuation', 'alternatives': [{'content': '.', 'confidence': '0.0'}]})
+    return Transcript.from_items(items)
+
+
+def brute_force(phrases, words):
+    return sorted((i, i + len(phrase), value) for value, phrase in enumerate(phrases)
+                  for i in range(len(words) - len(phrase) + 1) if words[i:i + len(phrase)] == phrase)
+
+
+def test_finds_every_occurrence_of_every_phrase():
+    rng = random.Random(7)
+    vocab = ['a', 'b', 'c', 'd']
+    for _ in range(50):
+        phrases = [[rng.choice(vocab) for _ in range(rng.randint(1, 4))] for _ in range(8)]
+        words = [rng.choice(vocab + ['']) for _ in range(60)]
+        matcher = PhraseMatcher()
+        for value, phrase in enumerate(phrases):
+            matcher.add(' '.join(phrase), value)
+        matcher.build()
+        assert sorted(matcher.finditer(words)) == brute_force(phrases, words)
+
+
+def test_matches_whole_words_only():
+    matcher = PhraseMatcher()
+    matcher.add('Scam', 'scam')
+    matcher.add("isn't it", 'isnt')
+    matcher.build()
+    words = ['what', 'a', 'scammer', 'scam', "isn't", 'it']
+    assert list(matcher.finditer(words)) == [(3, 4, 'scam'), (4, 6, 'isnt')]
+
+
+def test_candidates_are_the_customers_phrases_within_a_turn():
+    transcript = make_transcript([
+        ('spk_0', 'this is not a scam I promise'),
+        ('spk_1', 'honestly is this legit'),
+        ('spk_0', 'yes and there is no credit'),
+        ('spk_1', 'check that one more time will this hurt my credit'),
+    ])
+    prescreen = ObjectionPrescreen(LIBRARY)
+    found = prescreen.candidates(transcript)
+    # the agent's "scam" isn't the customer's, and "credit" / "check" are in different turns
+    assert [(c['id'], c['phrase'], c['turn']) for c in found] == [
+        ('is-this-a-scam', 'is this legit', 1), ('credit-check', 'will this hurt my credit', 3)]
+    assert found[0]['start_time'] == 9.0 and found[0]['end_time'] == 12.0
+
+
+def test_calls_without_candidates_are_counted_as_skipped():
+    prescreen = ObjectionPrescreen(LIBRARY)
+    assert prescreen.candidates(make_transcript([('spk_0', 'hello'), ('spk_1', 'hi there')])) == []
+    assert prescreen.candidates(make_transcript([('spk_0', 'hello')])) == []
+    prescreen.candidates(make_transcript([('spk_1', 'is this a scam')]))
+    assert (prescreen.calls, prescreen.skipped) == (3, 2)
+
+
+def test_excerpt_keeps_the_turns_around_each_candidate():
+    transcript = make_transcript([('spk_0' if i % 2 else 'spk_1', f'turn {i}') for i in range(8)]
+                                 + [('spk_1', 'sounds like a scam'), ('spk_0', 'it is not')])
+    prescreen = ObjectionPrescreen(LIBRARY, context_turns=1)
+    excerpt = prescreen.excerpt(transcript, prescreen.candidates(transcript))
+    assert excerpt == [{'speaker': 'spk_0', 'content': 'turn 7 .'},
+                       {'speaker': 'spk_1', 'content': 'sounds like a scam .'},
+                       {'speaker': 'spk_0', 'content': 'it is not .'}]
@@ -0,0 +1,79 @@
+import io
+import os
+import sys
+
+import pyarrow.parquet as pq
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from LocalClients import LocalS3Client
+from ProcessingMethods import RESULT_SCHEMAS, ResultSink, load_results
+
+OBJECTION = {'id': 'is-this-a-scam', 'actual_objection': 'is this a scam', 'agent_response': 'no', 'score': 4}
+ANALYTICS = {'duration': 120.0, 'talk_time': 90000.0, 'silence_time': 3000.0, 'talk_speed': 150.0,
+             'num_interruptions': None, 'overall_sentiment': None, 'talk_time_percent': 0.75,
+             'silence_time_percent': 0.025, 'categories': []}
+
+
+def part_files(s3, table):
+    return {key: pq.read_table(io.BytesIO(body)) for (bucket, key), body in s3.objects.items()
+            if key.startswith(f'results/{table}/')}
+
+
+def test_writes_a_part_file_per_table_and_date_with_the_fixed_schema():
+    s3 = LocalS3Client()
+    written = []
+    with ResultSink('bucket', 'batch-1', s3, on_flush=lambda *args: written.append(args)) as sink:
+        sink.add_scores('g1', [[OBJECTION, {'id': 'credit-check'}]], date='2024-05-01', agent='alice')
+        # the model found nothing, and g3's answer wasn't json
+        sink.add_scores('g2', [[]], date='2024-05-02')
+        sink.add_scores('g3', [], ['not json'])
+        sink.add_analytics('g1', ANALYTICS, date='2024-05-01')
+    scores = part_files(s3, 'objection-scores')
+    assert sorted(key.split('/')[3] for key in scores) == ['date=2024-05-01', 'date=2024-05-02', 'date=unknown']
+    assert all(table.schema.equals(RESULT_SCHEMAS['objection-scores']) for table in scores.values())
+    analytics = part_files(s3, 'call-analytics')
+    assert [table.schema.equals(RESULT_SCHEMAS['call-analytics']) for table in analytics.values()] == [True]
+    marked = [guid for table, key, guids in written if table == 'objection-scores' for guid in guids]
+    assert sorted(marked) == ['g1', 'g2', 'g3']
+    df = load_results('bucket', s3=s3).sort_values(['tracking_guid', 'objection_id'], na_position='first')
+    assert df['tracking_guid'].tolist() == ['g1', 'g1', 'g2', 'g3']
+    assert df['objection_id'].tolist()[:2] == ['credit-check', 'is-this-a-scam']
+    assert df['unparseable'].tolist() == [0, 0, 0, 1]
+    assert df['agent'].tolist()[:2] == ['alice', 'alice'] and df['agent'].isna().tolist()[2:] == [True, True]
+
+
+def test_flushes_every_flush_calls_calls_and_every_flush_interval():
+    s3 = LocalS3Client()
+    now = [0]
+    written = []
+    sink = ResultSink('bucket', 'batch-1', s3, flush_calls=3, flush_interval=10, clock=lambda: now[0],
+                      on_flush=lambda table, key, guids: written.extend(guids))
+    for guid in ['g1', 'g2', 'g3', 'g4']:
+        sink.add_scores(guid, [[OBJECTION]])
+    assert written == ['g1', 'g2', 'g3']
+    now[0] = 10
+    sink.add_scores('g5', [[OBJECTION]])
+    assert written == ['g1', 'g2', 'g3', 'g4', 'g5']
+    assert sink.files == 2
+
+
+def test_keeps_rows_that_failed_to_write_for_the_next_flush():
+    class FlakyS3(LocalS3Client):
+        failures = 1
+
+        def put_object(self, **kwargs):
+            if self.failures:
+                self.failures -= 1
+                raise ConnectionError('connection reset')
+            return super().put_object(**kwargs)
+
+    s3 = FlakyS3()
+    sink = ResultSink('bucket', 'batch-1', s3)
+    sink.add_scores('g1', [[OBJECTION]])
+    with pytest.raises(ConnectionError):
+        sink.flush()
+    assert [row['tracking_guid'] for row in sink.rows['objection-scores']] == ['g1']
+    assert len(sink.flush()) == 1
+    assert load_results('bucket', s3=s3)['tracking_guid'].tolist() == ['g1']
@@ -0,0 +1,115 @@
+import functools
+import io
+import json
+import os
+import sys
+
+import pandas as pd
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+import ProcessingMethods
+from LocalClients import LocalS3Client, LocalTranscribeClient, SimulatedClock
+
+# app.py reads objection-library.json from the working directory when it's imported
+_cwd = os.getcwd()
+os.chdir(ROOT)
+import app
+os.chdir(_cwd)
+
+with open(os.path.join(ROOT, 'normal-transcription.json')) as f:
+    TRANSCRIPT = ProcessingMethods.Transcript.from_items(json.load(f)['results']['items'])
+
+
+def run_batch(tmp_path, monkeypatch, content_hashes, fail=None, transcribe=None, state=None, max_transcription_jobs=2):
+    """
+    Runs run_pipeline over one call per content hash, with the recordings already uploaded, fake
+    transcribe and s3 clients on a simulated clock, the sample transcript for every call and a
+    canned model answer.
+    """
+    monkeypatch.chdir(tmp_path)
+    clock = SimulatedClock()
+    if transcribe is None:
+        transcribe = LocalTranscribeClient(latency=60, clock=clock.now, fail=fail)
+    transcribe.clock = clock.now
+    s3 = LocalS3Client()
+    log = 'Recording,Conference Time (seconds),TrackingGuid,Call Date,Agent\n' + ''.join(
+        f'https://example.com/page?RecordingSid=RE{i},{60 + i},g{i},2024-05-01,agent{i % 2}\n'
+        for i in range(len(content_hashes)))
+    s3.put_object(Bucket='logs', Key='call-log.csv', Body=log.encode())
+    if state is None:
+        state = ProcessingMethods.BatchStateStore(str(tmp_path / 'state.db'))
+        for i, content_hash in enumerate(content_hashes):
+            state.advance('batch-1', f'g{i}', 'uploaded', key=f'recordings/RE{i}.mp3', content_hash=content_hash)
+    monkeypatch.setattr(app, 'iter_call_log', functools.partial(ProcessingMethods.iter_call_log, s3=s3))
+    monkeypatch.setattr(app, 'TranscriptionJobScheduler', functools.partial(
+        ProcessingMethods.TranscriptionJobScheduler, sleep=clock.sleep, clock=clock.now))
+    monkeypatch.setattr(app, 'get_transcript', lambda uri, **kwargs: TRANSCRIPT)
+    monkeypatch.setattr(app, 'generate_score_responses', lambda *args, **kwargs: (
+        [[{'id': 'is-this-a-scam', 'actual_objection': 'is this a scam', 'agent_response': 'no', 'score': 4}]], []))
+    finished, errors = app.run_pipeline('logs', 'call-log.csv', 'uploads', 20, 'batch-1', transcribe=transcribe,
+                                        s3=s3, state=state, max_transcription_jobs=max_transcription_jobs)
+    return finished, errors, transcribe, s3, state
+
+
+def read_table(s3, table):
+    return pd.concat([pd.read_parquet(io.BytesIO(body)) for (bucket, key), body in s3.objects.items()
+                      if key.startswith(f'results/{table}/')], ignore_index=True)
+
+
+def test_transcribes_scores_and_writes_every_call(tmp_path, monkeypatch):
+    # g3 is the same recording as g2
+    finished, errors, transcribe, s3, state = run_batch(tmp_path, monkeypatch, ['h0', 'h1', 'h2', 'h2', 'h4'])
+    assert errors == []
+    assert len(finished) == 5
+    # whichever of g2 and g3 gets there first starts the job, the other shares it
+    assert len(transcribe.jobs) == 4
+    assert state.get('batch-1', 'g2')['job_name'] == state.get('batch-1', 'g3')['job_name']
+    assert all(state.get('batch-1', f'g{i}')['stage'] == 'written' for i in range(5))
+    scores = ProcessingMethods.load_results('uploads', s3=s3)
+    assert sorted(scores['tracking_guid']) == ['g0', 'g1', 'g2', 'g3', 'g4']
+    assert set(scores['agent']) == {'agent0', 'agent1'}
+    analytics = read_table(s3, 'call-analytics')
+    assert sorted(analytics['tracking_guid']) == ['g0', 'g1', 'g2', 'g3', 'g4']
+    assert analytics['talk_time'].gt(0).all()
+
+
+def test_keeps_to_max_transcription_jobs(tmp_path, monkeypatch):
+    _, errors, transcribe, _, _ = run_batch(tmp_path, monkeypatch, [f'h{i}' for i in range(8)],
+                                            max_transcription_jobs=3)
+    assert errors == []
+    jobs = transcribe.jobs.values()
+    assert len(jobs) == 8
+    assert max(sum(1 for job in jobs if job['started'] <= other['started'] < job['done_at'])
+               for other in jobs) == 3
+
+
+def test_skips_calls_already_written(tmp_path, monkeypatch):
+    _, _, transcribe, _, state = run_batch(tmp_path, monkeypatch, ['h0', 'h1'])
+    finished, errors, _, _, _ = run_batch(tmp_path, monkeypatch, ['h0', 'h1'], transcribe=transcribe, state=state)
+    assert finished == [] and errors == []
+    assert transcribe.calls['StartTranscriptionJob'] == 2
+
+
+def test_resubmits_a_failed_job_under_a_new_name(tmp_path, monkeypatch):
+    # the first job for g1's recording fails, the one started on the next run doesn't
+    fail = lambda job_name: job_name == 'RE1-batch-1'
+    _, errors, transcribe, _, state = run_batch(tmp_path, monkeypatch, ['h0', 'h1'], fail=fail)
+    assert [stage for stage, _, _ in errors] == ['fetch_transcript']
+    failed = state.get('batch-1', 'g1')
+    assert failed['stage'] == 'job_failed' and failed['job_attempts'] == 1
+    finished, errors, _, _, _ = run_batch(tmp_path, monkeypatch, ['h0', 'h1'], transcribe=transcribe, state=state)
+    assert errors == []
+    assert [item['call']['tracking_guid'] for item in finished] == ['g1']
+    assert state.get('batch-1', 'g1')['job_name'] == 'RE1-r1-batch-1'
+    assert state.get('batch-1', 'g1')['stage'] == 'written'
+
+
+def test_gives_up_after_max_transcription_attempts(tmp_path, monkeypatch):
+    _, _, transcribe, _, state = run_batch(tmp_path, monkeypatch, ['h0'], fail=lambda job_name: True)
+    for _ in range(app.MAX_TRANSCRIPTION_ATTEMPTS):
+        _, errors, _, _, _ = run_batch(tmp_path, monkeypatch, ['h0'], transcribe=transcribe, state=state)
+    assert len(transcribe.jobs) == app.MAX_TRANSCRIPTION_ATTEMPTS
+    assert [stage for stage, _, _ in errors] == ['start_job']
+    assert state.get('batch-1', 'g0')['stage'] == 'job_failed'
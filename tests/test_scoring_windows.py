@@ -0,0 +1,53 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from ProcessingMethods import estimate_tokens, merge_score_responses, split_turns_into_windows
+
+
+def scam(actual='Is this a scam?', agent_response='no'):
+    return {'id': 'is-this-a-scam', 'actual_objection': actual, 'agent_response': agent_response, 'score': 5}
+
+
+def test_windows_fit_and_overlap():
+    turns = [{'speaker': f'spk_{i % 2}', 'content': f'turn {i} ' + 'word ' * (10 + i % 7)} for i in range(60)]
+    windows = split_turns_into_windows(turns, max_tokens=200, overlap_turns=2)
+    assert len(windows) > 1
+    assert all(sum(estimate_tokens(str(turn)) + 1 for turn in window) <= 200 for window in windows)
+    for before, after in zip(windows, windows[1:]):
+        assert after[:2] == before[-2:]
+    # every turn, in order, once the overlaps are dropped
+    assert windows[0] + [turn for window in windows[1:] for turn in window[2:]] == turns
+
+
+def test_a_turn_too_long_for_a_window_is_split_on_words():
+    turns = [{'speaker': 'spk_1', 'content': ' '.join(f'w{i}' for i in range(400))}]
+    windows = split_turns_into_windows(turns, max_tokens=100, overlap_turns=0)
+    assert len(windows) > 1
+    assert ' '.join(turn['content'] for window in windows for turn in window) == turns[0]['content']
+
+
+def test_an_objection_in_the_overlap_is_kept_once_with_the_fuller_response():
+    merged = merge_score_responses([
+        ([[scam(agent_response='no')]], []),
+        ([[scam('is this a SCAM', agent_response='no, we have been accredited for 15 years')]], ['bad']),
+    ])
+    assert merged == ([[scam('is this a SCAM', agent_response='no, we have been accredited for 15 years')]], ['bad'])
+
+
+def test_distinct_objections_with_the_same_id_are_all_kept():
+    merged, _ = merge_score_responses([
+        ([[scam('is this a scam'), scam('how do I know you are real')]], []),
+        ([[scam('how do I know you are real'), scam('is this a scam'), scam('is this a scam')]], []),
+        ([[]], []),
+        ([[scam('is this a scam')]], []),
+    ])
+    # the second window's repeat of "is this a scam" is a new one (only one was in the window before),
+    # and so is the one in the fourth window, which doesn't overlap the second
+    assert [obj['actual_objection'] for obj in merged[0]] == [
+        'is this a scam', 'how do I know you are real', 'is this a scam', 'is this a scam']
+
+
+def test_nothing_found_in_any_window():
+    assert merge_score_responses([([[]], []), ([], ['not json'])]) == ([], ['not json'])
@@ -0,0 +1,49 @@
+import io
+import json
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.join(os.path.dirname(__file__), '..')
+sys.path.insert(0, ROOT)
+
+from ProcessingMethods import iter_transcript_items
+
+CHUNK_SIZES = [1, 2, 7, 64, 64 * 1024]
+
+
+@pytest.mark.parametrize('chunk_size', [7, 64 * 1024])
+def test_streams_the_same_items_as_json_load(chunk_size):
+    with open(os.path.join(ROOT, 'normal-transcription.json'), 'rb') as f:
+        expected = json.load(f)['results']['items']
+        f.seek(0)
+        assert list(iter_transcript_items(f, chunk_size)) == expected
+
+
+@pytest.mark.parametrize('chunk_size', CHUNK_SIZES)
+def test_skips_values_that_look_like_json_inside_strings(chunk_size):
+    items = [
+        {'type': 'pronunciation', 'alternatives': [{'content': 'café — \U0001F600', 'confidence': '0.99'}],
+         'start_time': '1.5', 'end_time': '2.25', 'speaker_label': 'spk_0'},
+        {'type': 'punctuation', 'alternatives': [{'content': '"]}', 'confidence': '0.0'}], 'speaker_label': 'spk_0'},
+    ]
+    document = {
+        'jobName': 'a "quoted" ] name {',
+        'accountId': 123456789012,
+        'results': {
+            'transcripts': [{'transcript': 'not [the] items, "really" {}'}],
+            'speaker_labels': {'segments': [{'items': [{'start_time': '1.5', 'speaker_label': 'spk_0'}]}]},
+            'items': items,
+            'audio_segments': [],
+        },
+        'status': 'COMPLETED',
+    }
+    body = io.BytesIO(json.dumps(document, ensure_ascii=False).encode('utf-8'))
+    assert list(iter_transcript_items(body, chunk_size)) == items
+
+
+def test_a_truncated_document_raises():
+    document = json.dumps({'results': {'items': [{'type': 'pronunciation'}, {'type': 'punctuation'}]}})
+    with pytest.raises(ValueError):
+        list(iter_transcript_items(io.BytesIO(document[:-12].encode()), 4))
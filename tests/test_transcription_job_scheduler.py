@@ -0,0 +1,69 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from LocalClients import LocalTranscribeClient, SimulatedClock
+from ProcessingMethods import TranscriptionJobScheduler
+
+
+def make_scheduler(durations, max_in_flight, max_concurrent_jobs=None, fail=None):
+    # one job per recording, each taking longer the longer the recording is
+    clock = SimulatedClock()
+    transcribe = LocalTranscribeClient(latency=lambda job_name, media_uri: 30 + durations.get(job_name, 0) / 3,
+                                       clock=clock.now, max_concurrent_jobs=max_concurrent_jobs, fail=fail)
+    scheduler = TranscriptionJobScheduler(transcribe, max_in_flight=max_in_flight, name_contains='batch-1',
+                                          sleep=clock.sleep, clock=clock.now)
+    for job_name, duration in durations.items():
+        scheduler.add(job_name, f's3://bucket/{job_name}.mp3', 'bucket', f'{job_name}.json', duration=duration)
+    return transcribe, scheduler
+
+
+def most_running_at_once(transcribe):
+    jobs = transcribe.jobs.values()
+    return max(sum(1 for job in jobs if job['started'] <= start < job['done_at']) for start in
+               [job['started'] for job in jobs])
+
+
+def test_never_runs_more_than_max_in_flight():
+    durations = {f'RE{i:04d}-batch-1': 60 + 10 * i for i in range(20)}
+    transcribe, scheduler = make_scheduler(durations, max_in_flight=5)
+    finished = list(scheduler.run())
+    assert sorted(summary['TranscriptionJobName'] for _, summary in finished) == sorted(durations)
+    assert all(summary['TranscriptionJobStatus'] == 'COMPLETED' for _, summary in finished)
+    assert most_running_at_once(transcribe) == 5
+
+
+def test_starts_the_longest_recordings_first():
+    durations = {'RE0000-batch-1': 30, 'RE0001-batch-1': 900, 'RE0002-batch-1': 60, 'RE0003-batch-1': 600}
+    transcribe, scheduler = make_scheduler(durations, max_in_flight=2)
+    list(scheduler.run())
+    started = sorted(transcribe.jobs.values(), key=lambda job: job['seq'])
+    assert [job['name'] for job in started] == ['RE0001-batch-1', 'RE0003-batch-1',
+                                                'RE0002-batch-1', 'RE0000-batch-1']
+
+
+def test_backs_off_to_a_lower_real_quota():
+    # other work in the account is using most of the quota
+    durations = {f'RE{i:04d}-batch-1': 60 for i in range(12)}
+    transcribe, scheduler = make_scheduler(durations, max_in_flight=10, max_concurrent_jobs=3)
+    finished = list(scheduler.run())
+    assert len(finished) == 12
+    assert all(summary['TranscriptionJobStatus'] == 'COMPLETED' for _, summary in finished)
+    assert scheduler.rejected > 0
+    assert most_running_at_once(transcribe) == 3
+
+
+def test_hands_back_failed_jobs_and_jobs_it_only_tracks():
+    durations = {'RE0000-batch-1': 60, 'RE0001-batch-1': 120}
+    transcribe, scheduler = make_scheduler(durations, max_in_flight=2,
+                                           fail=lambda job_name: job_name == 'RE0001-batch-1')
+    # started by a previous run
+    transcribe.start_transcription_job(TranscriptionJobName='RE0002-batch-1',
+                                       Media={'MediaFileUri': 's3://bucket/RE0002.mp3'})
+    scheduler.track('RE0002-batch-1')
+    finished = {summary['TranscriptionJobName']: (job, summary) for job, summary in scheduler.run()}
+    assert finished['RE0001-batch-1'][0]['media_s3_uri'] == 's3://bucket/RE0001-batch-1.mp3'
+    assert finished['RE0001-batch-1'][1]['TranscriptionJobStatus'] == 'FAILED'
+    assert finished['RE0002-batch-1'][0] is None
+    assert finished['RE0002-batch-1'][1]['TranscriptionJobStatus'] == 'COMPLETED'
@@ -0,0 +1,49 @@
+import datetime
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from LocalClients import LocalTranscribeClient, SimulatedClock
+from ProcessingMethods import TranscriptionJobTracker
+
+
+def make_client(num_jobs, old_job_age_minutes=30):
+    # num_jobs finished jobs; the first one (listed last) was created well before the others
+    clock = SimulatedClock()
+    transcribe = LocalTranscribeClient(latency=0, clock=clock.now)
+    for i in range(num_jobs):
+        transcribe.start_transcription_job(TranscriptionJobName=f'RE{i:04d}-batch-1',
+                                           Media={'MediaFileUri': f's3://bucket/RE{i:04d}.mp3'})
+    old = transcribe.jobs['RE0000-batch-1']
+    old['created'] -= datetime.timedelta(minutes=old_job_age_minutes)
+    return clock, transcribe, old['created']
+
+
+def test_finds_a_job_older_than_the_cutoff_on_a_later_page():
+    clock, transcribe, created = make_client(150)
+    tracker = TranscriptionJobTracker(transcribe, name_contains='batch-1', sleep=clock.sleep, clock=clock.now)
+    tracker.add('RE0000-batch-1', created=created)
+    done = tracker.poll()
+    assert [summary['TranscriptionJobName'] for summary in done] == ['RE0000-batch-1']
+    assert not tracker.pending
+
+
+def test_reads_every_page_when_the_creation_time_is_unknown():
+    clock, transcribe, _ = make_client(150)
+    tracker = TranscriptionJobTracker(transcribe, name_contains='batch-1', sleep=clock.sleep, clock=clock.now)
+    tracker.add('RE0000-batch-1')
+    assert [summary['TranscriptionJobName'] for summary in tracker.poll()] == ['RE0000-batch-1']
+
+
+def test_stops_paging_once_past_the_oldest_pending_job():
+    clock, transcribe, _ = make_client(250)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    for i, job in enumerate(transcribe.jobs.values()):
+        job['created'] = now - datetime.timedelta(minutes=250 - i)
+    tracker = TranscriptionJobTracker(transcribe, name_contains='batch-1', sleep=clock.sleep, clock=clock.now)
+    # still running somewhere, so it's never in the list of finished jobs
+    tracker.add('RE9999-batch-1', created=now.isoformat())
+    tracker.poll()
+    # one page of COMPLETED jobs reaches back past the cutoff, then one (empty) FAILED listing
+    assert transcribe.calls['ListTranscriptionJobs'] == 2